@@ -0,0 +1,55 @@
+import contextlib
+import os
+import threading
+
+################################################## ATOMIC WRITES ##################################################################
+
+# Files other processes read while they're being rewritten (partitions,
+# the model registry, the site index, ...) are written under a temporary
+# name in the same directory and then renamed over the old file, so
+# readers see either the old file or the new one, never part of one.
+
+def temp_path(path, suffix=""):
+    """
+    Returns a temporary name for path, unique to this process and thread,
+    so threads or processes writing the same file at once don't rename
+    each other's temporary files.
+    """
+    return "{}.{}.{}.tmp{}".format(path, os.getpid(), threading.get_ident(), suffix)
+
+@contextlib.contextmanager
+def replace_path(path, suffix=""):
+    """
+    Yields a temporary path to write path's new contents to, and renames
+    it over path when the block finishes. If the block raises, the
+    temporary file is removed and path is left as it was.
+
+    Parameters
+    -----–-----------
+    path: str
+        The file to replace. Its directory is created if needed.
+
+    suffix: str
+        Added to the end of the temporary name, for writers that add an
+        extension themselves (i.e. ".npy" for np.save).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = temp_path(path, suffix)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+@contextlib.contextmanager
+def replace_file(path, mode="w"):
+    """
+    Same as replace_path, but yields the temporary file opened with mode.
+    """
+    with replace_path(path) as tmp_path:
+        with open(tmp_path, mode) as f:
+            yield f
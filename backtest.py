@@ -0,0 +1,190 @@
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import io
+import os
+import time
+
+import argparse
+
+import dataset
+import evaluation
+import feature_store
+import model_registry
+import train_model
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+BACKTEST_DIR = "data/backtests"
+TRAIN_WINDOW_DAYS = 7
+
+# Hyperparameters to backtest with when there are no saved models to take
+# them from (see model_registry.py)
+DEFAULT_PARAMS = {'AdaBoost': {'n_estimators': 100, 'learning_rate': 0.5},
+                  'Random Forests': {'criterion': 'gini', 'max_depth': 20, 'min_samples_leaf': 10,
+                                     'max_features': 'sqrt', 'n_estimators': 150}}
+
+################################################## BACKTEST FUNCTIONS #############################################################
+
+
+def score_day(models, day_rows, day_labels, gameday):
+    """
+    Scores one day's rows with every model and returns one record per
+    model: whether its top pick got a hit, the share of its top 10 who
+    did, and the number of players it chose from.
+    """
+    probabilities = evaluation.predict_probabilities(models, day_rows)
+    records = []
+    for model_name, model_probabilities in probabilities.items():
+        hit_rates = evaluation.top_k_hit_rate(model_probabilities, day_labels, np.zeros(len(day_labels)), ks=[1, 10])
+        records.append({'date': gameday, 'model': model_name, 'top1_hit': hit_rates[1] == 1.0,
+                        'top10_hit_rate': hit_rates[10], 'players': len(day_labels)})
+    return records
+
+def backtest_days(test_days, store_dates, params, window=TRAIN_WINDOW_DAYS):
+    """
+    Walks forward through a run of consecutive test days. The models are
+    trained from scratch for the first day, then updated for each later
+    day with train_model.update_models(), exactly as the daily training
+    run does, so a day's models reuse everything fit for the window
+    before it. Returns one record per model per day (see score_day()).
+
+    Parameters
+    -----–-----------
+    test_days: list of datetime.date
+        The days to score, in order.
+
+    store_dates: list of datetime.date
+        Every labeled day in the feature store.
+
+    params: dict
+        Hyperparameters, as returned by train_model.search_hyperparameters().
+
+    window: int
+        The number of labeled days before each test day to train on.
+    """
+    records = []
+    models, trained_through = None, None
+    for gameday in test_days:
+        train_dates = [d for d in store_dates if d < gameday][-window:]
+        if not train_dates:
+            continue
+        hits = dataset.load_matrix(train_dates + [gameday])
+        is_test_day = hits.dates == np.datetime64(gameday)
+        data_test, labels_test = hits.features[is_test_day], hits.labels[is_test_day]
+        data_train, labels_train = hits.features[~is_test_day], hits.labels[~is_test_day]
+        train_day_of_row = hits.dates[~is_test_day]
+
+        # The training functions report their progress, which would be
+        # noise for every day of a season
+        with contextlib.redirect_stdout(io.StringIO()):
+            if models is None:
+                models = train_model.fit_models(params, data_train, labels_train)
+            else:
+                new_rows = train_day_of_row > np.datetime64(trained_through)
+                if new_rows.any():
+                    models = train_model.update_models(models, params, data_train, labels_train,
+                                                       data_train[new_rows], labels_train[new_rows])
+        trained_through = train_dates[-1]
+
+        if len(labels_test):
+            records += score_day(models, data_test, labels_test, gameday)
+    return records
+
+def init_backtest_worker():
+    # Each process trains on one core, so processes don't compete for them
+    train_model.N_JOBS = 1
+
+def streak_lengths(top1_hits):
+    """
+    Returns the length of the hitting streak after each day, given
+    whether each day's top pick got a hit.
+    """
+    top1_hits = np.asarray(top1_hits, dtype=bool)
+    streak_number = np.cumsum(~top1_hits)
+    return pd.Series(top1_hits.astype(int)).groupby(streak_number).cumsum().values
+
+def backtest(start_date=None, end_date=None, processes=4, window=TRAIN_WINDOW_DAYS, params=None):
+    """
+    Runs a walk-forward backtest over every labeled day in the feature
+    store between start_date and end_date: each day is scored with models
+    trained on the window of days before it. Days are split into
+    consecutive runs, one per process, and each process walks forward
+    through its run (see backtest_days()).
+
+    Results are written to data/backtests/backtest_<start>_<end>.csv with
+    one row per model per day, including the streak the model's top picks
+    would have had. Returns the results and a summary per model.
+
+    Parameters
+    -----–-----------
+    start_date, end_date: str
+        The first and last days to score, in MM/DD/YYYY format. Default to
+        the first and last days in the store that can be scored.
+
+    processes: int
+        The number of worker processes to use.
+
+    window: int
+        The number of labeled days before each day to train on.
+
+    params: dict
+        Hyperparameters for the models. Default to those of the current
+        saved models, or DEFAULT_PARAMS if there aren't any.
+    """
+    if params is None:
+        params = DEFAULT_PARAMS
+        if model_registry.read_registry()['current']:
+            params = model_registry.version_info()['metadata'].get('params', DEFAULT_PARAMS)
+
+    store_dates = feature_store.list_dates(labeled_only=True)
+    test_days = store_dates[1:]
+    if start_date is not None:
+        test_days = [d for d in test_days if d >= feature_store.to_date(start_date)]
+    if end_date is not None:
+        test_days = [d for d in test_days if d <= feature_store.to_date(end_date)]
+    if not test_days:
+        raise ValueError("No labeled days to backtest between {} and {}".format(start_date, end_date))
+
+    # Split the days into one consecutive run per process. Only the first
+    # day of each run trains from scratch.
+    runs = [list(run) for run in np.array_split(np.array(test_days, dtype=object), min(processes, len(test_days)))]
+
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=len(runs), initializer=init_backtest_worker) as pool:
+        futures = [pool.submit(backtest_days, run, store_dates, params, window) for run in runs]
+        for future in as_completed(futures):
+            records += future.result()
+
+    results = pd.DataFrame(records).sort_values(['model', 'date']).reset_index(drop=True)
+    results['streak'] = results.groupby('model')['top1_hit'].transform(streak_lengths)
+
+    summary = results.groupby('model').agg(days=('date', 'count'), top1_hit_rate=('top1_hit', 'mean'),
+                                           top10_hit_rate=('top10_hit_rate', 'mean'),
+                                           longest_streak=('streak', 'max'))
+
+    os.makedirs(BACKTEST_DIR, exist_ok=True)
+    results_file = os.path.join(BACKTEST_DIR, "backtest_{}_{}.csv".format(test_days[0].strftime("%m_%d_%Y"),
+                                                                          test_days[-1].strftime("%m_%d_%Y")))
+    results.to_csv(results_file, index=False)
+
+    print("Backtested {} days in {:.1f}s: \n".format(len(test_days), time.perf_counter() - start), summary)
+    print("Finished generating file: {}".format(results_file))
+    return results, summary
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Walk-forward backtest of the models' top picks over days in the feature store")
+    arg_parser.add_argument("--start", help = "First day to score, i.e. 08/20/2019 (default: earliest possible)")
+    arg_parser.add_argument("--end", help = "Last day to score, i.e. 09/15/2019 (default: latest labeled day)")
+    arg_parser.add_argument("--processes", help = "Number of worker processes to use (default: 4)", type=int, default=4)
+    arg_parser.add_argument("--window", help = "Number of days to train on before each day (default: {})".format(TRAIN_WINDOW_DAYS),
+                            type=int, default=TRAIN_WINDOW_DAYS)
+    args = arg_parser.parse_args(argv)
+
+    backtest(args.start, args.end, processes=args.processes, window=args.window)
+
+if __name__ == "__main__":
+    main()
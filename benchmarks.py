@@ -0,0 +1,252 @@
+import pandas as pd
+
+import contextlib
+import datetime
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import argparse
+
+import backtest
+import dataset
+import evaluation
+import feature_store
+import fixtures
+import model_registry
+import predict
+import retrieve_data
+import train_model
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# Every run adds one row per benchmark to BENCHMARK_HISTORY, tagged with
+# the commit it ran on, so throughput can be compared across commits.
+BENCHMARK_HISTORY = "data/benchmarks/history.csv"
+HISTORY_COLUMNS = ['timestamp', 'commit', 'benchmark', 'settings', 'seconds', 'items', 'items_per_second']
+
+################################################## BENCHMARK FUNCTIONS ############################################################
+
+def current_commit():
+    """
+    Returns the short hash of the checked out commit, with a + if there
+    are uncommitted changes, or "unknown" outside of a git repository.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def best_time(func, repeat):
+    """
+    Runs func repeat times with its output hidden, and returns the
+    fastest time in seconds along with func's last return value.
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+    return min(times), result
+
+def bench_feature_generation(gameday, fixture_set, labeled=True, latency=0.0, repeat=3):
+    """
+    Times generate_hits_data() for a full slate, replaying the API
+    responses recorded in a fixture set. The response cache is off and
+    the day's pitcher table and player index are rebuilt on every
+    repeat, and rows are written to a temporary feature store. Returns
+    the fastest time and the number of rows generated.
+
+    Parameters
+    -----–-----------
+    gameday: str
+        The day the fixture set was recorded for, in MM/DD/YYYY format.
+
+    fixture_set: str
+        The name of the fixture set in data/fixtures.
+
+    labeled: bool
+        Whether the fixture set was recorded with --train (True) or
+        --test (False).
+
+    latency: float
+        Simulated seconds per request.
+
+    repeat: int
+        The number of times to run it.
+    """
+    store_dirs = feature_store.FEATURE_STORE_DIR, feature_store.STAGING_DIR
+    use_cache = retrieve_data.USE_CACHE
+    temp_dir = tempfile.mkdtemp()
+    try:
+        feature_store.FEATURE_STORE_DIR = os.path.join(temp_dir, "feature_store")
+        feature_store.STAGING_DIR = os.path.join(temp_dir, "staging")
+        retrieve_data.USE_CACHE = False
+        fixtures.configure('replay', fixture_set, latency=latency)
+
+        def generate():
+            retrieve_data.pitcher_tables.clear()
+            retrieve_data.player_indexes.clear()
+            retrieve_data.past_n_tables.clear()
+            retrieve_data.generate_hits_data(generate_train_data=labeled, gameday=gameday)
+            return len(feature_store.read_partition(gameday, columns=['ID']))
+
+        return best_time(generate, repeat)
+    finally:
+        fixtures.configure(None)
+        retrieve_data.USE_CACHE = use_cache
+        feature_store.FEATURE_STORE_DIR, feature_store.STAGING_DIR = store_dirs
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def load_training_window(days=7):
+    """
+    Reads the last `days` labeled days in the feature store, split into
+    training and validation rows the same way train_model.py splits them.
+    """
+    hits = dataset.load_matrix(feature_store.list_dates(labeled_only=True)[-days:])
+    in_val_set = dataset.validation_mask(hits)
+    return (hits.features[~in_val_set], hits.labels[~in_val_set], hits.features[in_val_set], 
+            hits.labels[in_val_set], hits.dates[in_val_set])
+
+def bench_training(repeat=3):
+    """
+    Times fitting all three models from scratch on the last 7 labeled
+    days in the feature store, with fixed hyperparameters
+    (backtest.DEFAULT_PARAMS), followed by evaluation on the validation
+    rows. Returns the fastest time, the number of training rows, and the
+    fitted models.
+    """
+    data_train, labels_train, data_val, labels_val, dates_val = load_training_window()
+
+    def train():
+        models = train_model.fit_models(backtest.DEFAULT_PARAMS, data_train, labels_train)
+        evaluation.evaluate_models(models, data_val, labels_val, groups=dates_val)
+        return models
+
+    seconds, models = best_time(train, repeat)
+    return seconds, len(data_train), models
+
+def bench_prediction(models, repeat=3):
+    """
+    Times what predict.py does: loading the best model from the registry
+    (memory-mapped), scoring a slate and naming the top 10's teams.
+    The models are saved to a temporary registry, and the slate is the
+    last day in the feature store. Returns the fastest time and the
+    number of rows scored.
+    """
+    registry_paths = model_registry.MODEL_DIR, model_registry.REGISTRY_FILE
+    temp_dir = tempfile.mkdtemp()
+    try:
+        model_registry.MODEL_DIR = temp_dir
+        model_registry.REGISTRY_FILE = os.path.join(temp_dir, "registry.json")
+        model_registry.save_models(models, "benchmark", "Random Forests")
+        slate = feature_store.read_partition(feature_store.list_dates()[-1])
+
+        def score():
+            return predict.make_predictions(model_registry.load_model(), slate)
+
+        seconds, _ = best_time(score, repeat)
+        return seconds, len(slate)
+    finally:
+        model_registry.MODEL_DIR, model_registry.REGISTRY_FILE = registry_paths
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def record_results(results):
+    """
+    Adds a run's results to the benchmark history and prints them next
+    to the last run with the same settings on a different commit.
+
+    Parameters
+    -----–-----------
+    results: list of dict
+        One dictionary per benchmark with the keys in HISTORY_COLUMNS.
+    """
+    if os.path.exists(BENCHMARK_HISTORY):
+        history = pd.read_csv(BENCHMARK_HISTORY)
+    else:
+        history = pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    print("{:<20} {:>9} {:>12} {:>22}".format("benchmark", "seconds", "items/s", "vs. last commit"))
+    for result in results:
+        previous = history[(history['benchmark'] == result['benchmark']) & (history['settings'] == result['settings'])
+                           & (history['commit'] != result['commit'])]
+        comparison = "-"
+        if len(previous):
+            last = previous.iloc[-1]
+            comparison = "{:+.1%} ({})".format(result['items_per_second'] / last['items_per_second'] - 1, last['commit'])
+        print("{:<20} {:>9.3f} {:>12.1f} {:>22}".format(result['benchmark'], result['seconds'],
+                                                         result['items_per_second'], comparison))
+
+    os.makedirs(os.path.dirname(BENCHMARK_HISTORY), exist_ok=True)
+    new_rows = pd.DataFrame(results, columns=HISTORY_COLUMNS)
+    history = new_rows if history.empty else pd.concat([history, new_rows], ignore_index=True)
+    history.to_csv(BENCHMARK_HISTORY, index=False)
+
+def run_benchmarks(gameday=None, fixture_set=None, labeled=True, latency=0.0, repeat=3):
+    """
+    Runs the benchmark suite and records the results (see
+    record_results). Feature generation is only benchmarked when a day
+    with a recorded fixture set is given; training and prediction always
+    run on the feature store.
+
+    Record a fixture set for a day first with
+
+        python retrieve_data.py --train --date 09/15/2019 --record 2019-09-15
+
+    Parameters
+    -----–-----------
+    gameday: str
+        The day of the fixture set, in MM/DD/YYYY format.
+
+    fixture_set: str
+        The name of the fixture set. Defaults to the day in YYYY-MM-DD
+        format.
+
+    labeled, latency, repeat:
+        See bench_feature_generation().
+    """
+    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+    commit = current_commit()
+    results = []
+
+    def add_result(benchmark, settings, seconds, items):
+        results.append({'timestamp': timestamp, 'commit': commit, 'benchmark': benchmark, 'settings': settings,
+                        'seconds': seconds, 'items': items, 'items_per_second': items / seconds})
+
+    if gameday is not None:
+        fixture_set = fixture_set or feature_store.to_date(gameday).isoformat()
+        seconds, rows = bench_feature_generation(gameday, fixture_set, labeled, latency, repeat)
+        add_result("feature_generation", "fixtures={} labeled={} latency={}".format(fixture_set, labeled, latency),
+                   seconds, rows)
+
+    seconds, rows, models = bench_training(repeat)
+    add_result("training", "days=7", seconds, rows)
+
+    seconds, rows = bench_prediction(models, repeat)
+    add_result("prediction", "last_day", seconds, rows)
+
+    record_results(results)
+    return results
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Time feature generation, training and prediction, and record the results in {}".format(BENCHMARK_HISTORY))
+    arg_parser.add_argument("--date", help = "Day of a recorded fixture set to benchmark feature generation on, i.e. 09/15/2019")
+    arg_parser.add_argument("--fixtures", help = "Name of the fixture set in data/fixtures (default: the day as YYYY-MM-DD)")
+    arg_parser.add_argument("--test", help = "The fixture set was recorded with --test rather than --train", action="store_true")
+    arg_parser.add_argument("--latency", help = "Simulated seconds per request (default: 0)", type=float, default=0.0)
+    arg_parser.add_argument("--repeat", help = "Times to run each benchmark, keeping the fastest (default: 3)",
+                            type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    run_benchmarks(args.date, args.fixtures, labeled=not args.test, latency=args.latency, repeat=args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import numpy as np
+import pyarrow.parquet as pq
+
+import datetime
+import hashlib
+import json
+import os
+
+from collections import namedtuple
+
+import argparse
+
+import atomic_files
+import feature_store
+import instrumentation
+from feature_store import FEATURE_COLUMNS, LABEL_COLUMN, STORE_SCHEMA
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# Each feature store partition is converted once into arrays the models
+# can use directly, and cached next to it as .npy files that are
+# memory-mapped when read:
+#
+#     data/matrices/date=2019-08-20/features.npy   float32, rows x FEATURE_COLUMNS
+#     data/matrices/date=2019-08-20/labels.npy     float32, 1.0/0.0, NaN if unlabeled
+#     data/matrices/date=2019-08-20/ids.npy        int64 player IDs
+#     data/matrices/date=2019-08-20/meta.json
+#
+# meta.json records the partition's size and modification time and the
+# feature columns, so a day is converted again when its partition is
+# rewritten (i.e. relabeled) or the schema changes.
+MATRIX_DIR = "data/matrices"
+SCHEMA_VERSION = hashlib.sha1(json.dumps(FEATURE_COLUMNS).encode("utf-8")).hexdigest()[:12]
+
+Matrix = namedtuple('Matrix', ['features', 'labels', 'ids', 'dates'])
+Matrix.__doc__ = """
+Rows of the feature store as arrays: features (float32, one column per
+FEATURE_COLUMNS entry, in that order), labels (float32), ids (the
+players' IDs) and dates (datetime64[D]), all with one entry per row.
+"""
+
+class SchemaError(ValueError):
+    """
+    Raised when a feature store partition doesn't have the columns (and
+    types) in feature_store.STORE_SCHEMA.
+    """
+
+################################################## MATRIX FUNCTIONS ###############################################################
+
+def validate_schema(schema, source):
+    """
+    Checks that a partition's schema has every column in STORE_SCHEMA
+    with the same type. Raises SchemaError naming the columns that are
+    missing or have the wrong type. Column order doesn't matter, since
+    columns are always picked by name.
+
+    Parameters
+    -----–-----------
+    schema: pa.Schema
+        The partition's schema.
+
+    source: str
+        Where the schema came from (i.e. the partition's path), for the
+        error message.
+    """
+    missing = [field.name for field in STORE_SCHEMA if field.name not in schema.names]
+    mistyped = ["{} ({}, expected {})".format(field.name, schema.field(field.name).type, field.type)
+                for field in STORE_SCHEMA
+                if field.name in schema.names and not schema.field(field.name).type.equals(field.type)]
+    if missing or mistyped:
+        raise SchemaError("{} doesn't match the feature store schema. Missing: {}. Wrong type: {}".format(
+            source, ", ".join(missing) or "none", ", ".join(mistyped) or "none"))
+
+def feature_matrix(player_stats_table):
+    """
+    Returns the FEATURE_COLUMNS of a dataframe of player stats as a
+    contiguous float32 array, in schema order. Raises SchemaError if any
+    feature column is missing.
+    """
+    missing = [column for column in FEATURE_COLUMNS if column not in player_stats_table]
+    if missing:
+        raise SchemaError("Player stats are missing feature columns: {}".format(", ".join(missing)))
+    return np.ascontiguousarray(player_stats_table[FEATURE_COLUMNS].to_numpy(dtype=np.float32))
+
+def matrix_dir(gameday):
+    return os.path.join(MATRIX_DIR, "date={}".format(feature_store.to_date(gameday).isoformat()))
+
+def partition_signature(gameday):
+    stat = os.stat(feature_store.partition_path(gameday))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'schema': SCHEMA_VERSION}
+
+@instrumentation.traced('storage')
+def build_day(gameday):
+    """
+    Converts a day's partition into the cached arrays (see MATRIX_DIR),
+    after checking it against the schema. Each file is written under a
+    temporary name and then renamed, and meta.json is written last, so
+    processes converting the same day at once don't see partial files.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day to convert (i.e. "08/20/2019")
+    """
+    path = feature_store.partition_path(gameday)
+    signature = partition_signature(gameday)
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    validate_schema(parquet_file.schema_arrow, path)
+
+    table = parquet_file.read(columns=['ID'] + FEATURE_COLUMNS + [LABEL_COLUMN]).to_pandas()
+    arrays = {'features': feature_matrix(table),
+              'labels': table[LABEL_COLUMN].astype("float32").to_numpy(dtype=np.float32, na_value=np.nan),
+              'ids': table['ID'].to_numpy(dtype=np.int64)}
+
+    directory = matrix_dir(gameday)
+    for name, array in arrays.items():
+        with atomic_files.replace_path(os.path.join(directory, name + ".npy"), suffix=".npy") as tmp_path:
+            np.save(tmp_path, array)
+
+    with atomic_files.replace_file(os.path.join(directory, "meta.json")) as f:
+        json.dump(dict(signature, rows=len(table)), f)
+
+def load_day(gameday):
+    """
+    Returns a day's cached arrays as a dictionary with the keys
+    'features', 'labels' and 'ids', memory-mapped (read-only). The day
+    is converted first if it hasn't been, or if its partition or the
+    schema has changed since.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day to load (i.e. "08/20/2019")
+    """
+    directory = matrix_dir(gameday)
+    meta_path = os.path.join(directory, "meta.json")
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is None or {key: meta.get(key) for key in ['size', 'mtime_ns', 'schema']} != partition_signature(gameday):
+        build_day(gameday)
+    return {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode='r')
+            for name in ['features', 'labels', 'ids']}
+
+@instrumentation.traced('storage')
+def load_matrix(dates, complete_only=True):
+    """
+    Loads the rows for a list of days from the feature store as a Matrix,
+    with the days' features in one contiguous float32 array. Each day
+    comes from its cached arrays (see load_day), so only days that are
+    new or have changed are read from Parquet.
+
+    Parameters
+    -----–-----------
+    dates: list of str or datetime.date
+        The days to load, in the order their rows should appear.
+
+    complete_only: bool
+        Drop rows with a missing feature or label, as training does.
+    """
+    days = [load_day(gameday) for gameday in dates]
+    rows = [len(day['ids']) for day in days]
+    n_rows = sum(rows)
+
+    # Copy every day straight into one preallocated array
+    features = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+    labels = np.empty(n_rows, dtype=np.float32)
+    ids = np.empty(n_rows, dtype=np.int64)
+    offset = 0
+    for day in days:
+        end = offset + len(day['ids'])
+        features[offset:end], labels[offset:end], ids[offset:end] = day['features'], day['labels'], day['ids']
+        offset = end
+    dates = np.repeat(np.array([feature_store.to_date(gameday) for gameday in dates], dtype="datetime64[D]"), rows)
+
+    if complete_only:
+        complete = ~np.isnan(features).any(axis=1) & ~np.isnan(labels)
+        if not complete.all():
+            return Matrix(features[complete], labels[complete], ids[complete], dates[complete])
+    return Matrix(features, labels, ids, dates)
+
+def validation_mask(matrix, folds=5):
+    """
+    Returns which rows of a Matrix are in the validation set. Rows are
+    assigned by player ID and date rather than at random, so a row stays
+    on the same side of the split from one day to the next and
+    incrementally trained models never see rows they're validated on.
+    """
+    day_numbers = matrix.dates.astype("datetime64[D]").astype(np.int64) + datetime.date(1970, 1, 1).toordinal()
+    return (matrix.ids + day_numbers) % folds == 0
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Convert feature store partitions into cached float32 matrices in {}".format(MATRIX_DIR))
+    arg_parser.add_argument("--start", help = "First day to convert, i.e. 08/20/2019 (default: the first day in the store)")
+    arg_parser.add_argument("--end", help = "Last day to convert, i.e. 09/15/2019 (default: the last day in the store)")
+    args = arg_parser.parse_args(argv)
+
+    dates = [d for d in feature_store.list_dates()
+             if (args.start is None or d >= feature_store.to_date(args.start))
+             and (args.end is None or d <= feature_store.to_date(args.end))]
+    for gameday in dates:
+        build_day(gameday)
+    matrix = load_matrix(dates, complete_only=False)
+    print("Converted {} days: {} rows, {:.1f} MB of features".format(len(dates), len(matrix.ids),
+                                                                      matrix.features.nbytes / 1e6))
+
+if __name__ == "__main__":
+    main()
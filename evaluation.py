@@ -0,0 +1,256 @@
+import pandas as pd
+import numpy as np
+
+import json
+import os
+
+import instrumentation
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+MODEL_STATS_DIR = "data/model_stats"
+
+# A row is predicted to get a hit when its hit probability is above
+# DECISION_THRESHOLD, which matches each model's predict().
+DECISION_THRESHOLD = 0.5
+SWEEP_THRESHOLDS = np.round(np.arange(0.05, 1.0, 0.05), 2)
+TOP_K = [1, 5, 10, 25]
+CALIBRATION_BINS = 10
+
+################################################## EVALUATION FUNCTIONS ###########################################################
+
+# Every metric here is computed from each model's hit probabilities,
+# which are predicted once per model by predict_probabilities(). Adding a
+# metric doesn't add an inference pass, and adding a model adds exactly one.
+
+def predict_probabilities(models, data):
+    """
+    Returns a dictionary mapping each model's name to its hit probability
+    for every row of data, as a numpy array.
+
+    Parameters
+    -----–-----------
+    models: dict
+        Maps each model's name to the fitted model.
+
+    data: pd.DataFrame
+        Features to score.
+    """
+    return {model_name: model.predict_proba(data)[:, 1] for model_name, model in models.items()}
+
+def threshold_metrics(probabilities, labels, thresholds):
+    """
+    Returns the accuracy, precision, recall and F1 score of a model's
+    predictions at each threshold, as a dataframe with one row per
+    threshold. All thresholds are scored at once with a
+    (thresholds x rows) array of predictions.
+
+    Parameters
+    -----–-----------
+    probabilities: np.ndarray
+        Hit probabilities, as returned by predict_probabilities().
+
+    labels: array-like
+        Whether each player actually got a hit.
+
+    thresholds: array-like
+        The thresholds to predict a hit above.
+    """
+    labels = np.asarray(labels, dtype=bool)
+    thresholds = np.asarray(thresholds, dtype=float)
+    predicted = probabilities[np.newaxis, :] > thresholds[:, np.newaxis]
+
+    true_pos = (predicted & labels).sum(axis=1)
+    predicted_pos = predicted.sum(axis=1)
+    actual_pos = labels.sum()
+    correct = (predicted == labels).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted_pos > 0, true_pos / predicted_pos, 0.0)
+        recall = np.where(actual_pos > 0, true_pos / actual_pos, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    return pd.DataFrame({'Threshold': thresholds, 'Accuracy': correct / len(labels),
+                         'Precision': precision, 'Recall': recall, 'F1 Score': f1})
+
+def top_k_hit_rate(probabilities, labels, groups, ks=TOP_K):
+    """
+    Returns a dictionary mapping each k to the share of each group's k
+    most likely players who actually got a hit, averaged over groups
+    (i.e. over days, since the picks are each day's top 10).
+
+    Parameters
+    -----–-----------
+    probabilities: np.ndarray
+        Hit probabilities, as returned by predict_probabilities().
+
+    labels: array-like
+        Whether each player actually got a hit.
+
+    groups: array-like
+        The group (usually the date) of each row.
+
+    ks: list of int
+        The numbers of top players to score.
+    """
+    labels = np.asarray(labels, dtype=float)
+    group_codes = pd.factorize(np.asarray(groups))[0]
+
+    # Sort by group, then by descending probability, and rank each row
+    # within its group
+    order = np.lexsort((-probabilities, group_codes))
+    sorted_groups = group_codes[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(order)])
+    ranks = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+
+    hit_rates = {}
+    for k in ks:
+        in_top_k = ranks < k
+        hits = np.bincount(sorted_groups[in_top_k], weights=labels[order][in_top_k])
+        picks = np.bincount(sorted_groups[in_top_k])
+        hit_rates[k] = float(np.mean(hits / picks)) if len(picks) else float("nan")
+    return hit_rates
+
+def roc_curve_and_auc(probabilities, labels):
+    """
+    Returns the ROC curve (false and true positive rates at each distinct
+    probability) and the area under it, from a single sort of the
+    probabilities.
+
+    Parameters
+    -----–-----------
+    probabilities: np.ndarray
+        Hit probabilities, as returned by predict_probabilities().
+
+    labels: array-like
+        Whether each player actually got a hit.
+    """
+    labels = np.asarray(labels, dtype=bool)
+    order = np.argsort(-probabilities, kind="mergesort")
+    sorted_probabilities, sorted_labels = probabilities[order], labels[order]
+
+    # Only keep the last row of each run of tied probabilities, so ties
+    # move the curve diagonally
+    distinct = np.r_[sorted_probabilities[1:] != sorted_probabilities[:-1], True]
+    true_pos = np.cumsum(sorted_labels)[distinct]
+    false_pos = np.cumsum(~sorted_labels)[distinct]
+
+    tpr = np.r_[0.0, true_pos / max(true_pos[-1], 1)]
+    fpr = np.r_[0.0, false_pos / max(false_pos[-1], 1)]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    return fpr, tpr, auc
+
+def calibration_table(probabilities, labels, bins=CALIBRATION_BINS):
+    """
+    Splits the probabilities into equal-width bins and returns, for each
+    non-empty bin, the number of rows, the mean predicted probability
+    and the share of rows that actually got a hit, along with the
+    expected calibration error (the row-weighted mean gap between the
+    two).
+
+    Parameters
+    -----–-----------
+    probabilities: np.ndarray
+        Hit probabilities, as returned by predict_probabilities().
+
+    labels: array-like
+        Whether each player actually got a hit.
+
+    bins: int
+        The number of bins between 0 and 1.
+    """
+    labels = np.asarray(labels, dtype=float)
+    bin_index = np.minimum((probabilities * bins).astype(int), bins - 1)
+    counts = np.bincount(bin_index, minlength=bins)
+    predicted_sums = np.bincount(bin_index, weights=probabilities, minlength=bins)
+    actual_sums = np.bincount(bin_index, weights=labels, minlength=bins)
+
+    non_empty = counts > 0
+    mean_predicted = predicted_sums[non_empty] / counts[non_empty]
+    actual_rate = actual_sums[non_empty] / counts[non_empty]
+    ece = float(np.sum(counts[non_empty] * np.abs(mean_predicted - actual_rate)) / max(counts.sum(), 1))
+
+    table = pd.DataFrame({'bin_start': np.arange(bins)[non_empty] / bins, 'count': counts[non_empty],
+                          'mean_predicted': mean_predicted, 'actual_rate': actual_rate})
+    return table, ece
+
+@instrumentation.traced('stage')
+def evaluate_models(models, data, labels, groups=None, probabilities=None):
+    """
+    Scores every model on a labeled dataset. Returns two things:
+
+        - performance: a dataframe with one row per model and the
+          columns Model, Accuracy, Precision, Recall and F1 Score at
+          DECISION_THRESHOLD (the format of the performance CSVs shown
+          on the website)
+        - details: a JSON-serializable dictionary with, for each model,
+          the threshold sweep, top-k hit rates, ROC curve and AUC, and
+          calibration table
+
+    Parameters
+    -----–-----------
+    models: dict
+        Maps each model's name to the fitted model.
+
+    data: pd.DataFrame
+        Features to score.
+
+    labels: array-like
+        Whether each player actually got a hit.
+
+    groups: array-like
+        The date of each row, for the top-k hit rates. Defaults to
+        treating every row as the same day.
+
+    probabilities: dict
+        Probabilities already returned by predict_probabilities() for
+        this data, to avoid predicting them again.
+    """
+    if probabilities is None:
+        probabilities = predict_probabilities(models, data)
+    if groups is None:
+        groups = np.zeros(len(labels))
+
+    performance_rows, details = [], {}
+    for model_name, model_probabilities in probabilities.items():
+        thresholds = np.r_[DECISION_THRESHOLD, SWEEP_THRESHOLDS]
+        sweep = threshold_metrics(model_probabilities, labels, thresholds)
+        fpr, tpr, auc = roc_curve_and_auc(model_probabilities, labels)
+        calibration, ece = calibration_table(model_probabilities, labels)
+
+        performance_rows.append([model_name] + sweep.iloc[0][['Accuracy', 'Precision', 'Recall', 'F1 Score']].tolist())
+        details[model_name] = {'auc': auc,
+                               'expected_calibration_error': ece,
+                               'top_k_hit_rate': top_k_hit_rate(model_probabilities, labels, groups),
+                               'threshold_sweep': sweep.iloc[1:].to_dict('list'),
+                               'roc_curve': {'fpr': fpr.tolist(), 'tpr': tpr.tolist()},
+                               'calibration': calibration.to_dict('list')}
+
+    performance = pd.DataFrame(performance_rows, columns=['Model', 'Accuracy', 'Precision', 'Recall', "F1 Score"])
+    return performance, details
+
+@instrumentation.traced('storage')
+def write_model_stats(performance, details, gameday):
+    """
+    Writes a day's evaluation to data/model_stats in one batch:
+    performance_MM_DD_YYYY.csv, in the format the website reads, and
+    evaluation_MM_DD_YYYY.json with the detailed metrics. Returns the
+    paths of both files.
+
+    Parameters
+    -----–-----------
+    performance, details: pd.DataFrame, dict
+        As returned by evaluate_models().
+
+    gameday: str
+        The day in MM_DD_YYYY format.
+    """
+    os.makedirs(MODEL_STATS_DIR, exist_ok=True)
+    performance_file = os.path.join(MODEL_STATS_DIR, "performance_{}.csv".format(gameday))
+    details_file = os.path.join(MODEL_STATS_DIR, "evaluation_{}.json".format(gameday))
+
+    performance.to_csv(performance_file, index=False)
+    with open(details_file, "w") as f:
+        json.dump(details, f, indent=1, default=float)
+    return performance_file, details_file
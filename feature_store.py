@@ -0,0 +1,357 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.fs
+
+import datetime
+import glob
+import json
+import os
+import shutil
+
+from collections import OrderedDict
+
+import argparse
+
+import atomic_files
+import instrumentation
+
+################################################## COLUMN SCHEMA ##################################################################
+
+# Column schema for player stats. Rows are built to match these lists
+# exactly, so the columns are known ahead of time and don't depend on
+# which stats the API happens to return for a player.
+ID_COLUMNS = ['Name', 'ID', 'Team']
+SEASON_HITTING_STATS = ['gamesPlayed', 'groundOuts', 'runs', 'doubles', 'triples', 'homeRuns', 'strikeOuts',
+                        'baseOnBalls', 'intentionalWalks', 'hits', 'hitByPitch', 'avg', 'atBats', 'obp', 'slg',
+                        'ops', 'caughtStealing', 'stolenBases', 'stolenBasePercentage', 'groundIntoDoublePlay',
+                        'numberOfPitches', 'plateAppearances', 'totalBases', 'rbi', 'leftOnBase', 'sacBunts',
+                        'sacFlies', 'babip', 'groundOutsToAirouts', 'atBatsPerHomeRun']
+PAST_N_HITTING_STATS = ['atBatsPerHomeRun', 'avg', 'hits', 'obp', 'ops', 'slg']
+PAST_N_PITCHING_STATS = ['avg', 'era', 'groundOutsToAirouts', 'hitsPer9Inn', 'homeRunsPer9', 'inningsPitched',
+                         'pitchesPerInning', 'runsScoredPer9', 'stolenBasePercentage', 'strikePercentage',
+                         'strikeoutWalkRatio', 'strikeoutsPer9Inn', 'walksPer9Inn', 'whip', 'winPercentage']
+H2H_HITTING_STATS = ['atBats', 'avg', 'hits', 'obp', 'ops', 'slg']
+
+FEATURE_COLUMNS = (SEASON_HITTING_STATS
+                   + [stat + "_p7G" for stat in PAST_N_HITTING_STATS]
+                   + [stat + "_p15G" for stat in PAST_N_HITTING_STATS]
+                   + [stat + "_p5G" for stat in PAST_N_PITCHING_STATS]
+                   + [stat + "_h2h" for stat in H2H_HITTING_STATS]
+                   + ['pitcher_hitter_opposite_hand'])
+LABEL_COLUMN = 'player_got_hit'
+
+################################################## FEATURE STORE ##################################################################
+
+# One Parquet file per day, in hive-style date partitions:
+#
+#     data/feature_store/date=2019-08-20/part-0.parquet
+#
+FEATURE_STORE_DIR = "data/feature_store"
+
+STORE_SCHEMA = pa.schema([('Name', pa.string()), ('ID', pa.int64()), ('Team', pa.int64())]
+                         + [(column, pa.float64()) for column in FEATURE_COLUMNS]
+                         + [(LABEL_COLUMN, pa.bool_())])
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.date32())]), flavor="hive")
+
+def to_date(gameday):
+    """
+    Converts a date in any of the formats used in this project
+    (MM/DD/YYYY, MM_DD_YYYY or a datetime.date) to a datetime.date.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The date to convert (i.e. "08/20/2019")
+    """
+    if isinstance(gameday, datetime.date):
+        return gameday
+    return datetime.datetime.strptime(gameday.replace("_", "/"), "%m/%d/%Y").date()
+
+def current_day(days_ago=0):
+    """
+    Returns today's date, or the date days_ago days before it, in 
+    MM/DD/YYYY format. Worked out when it's called rather than when a
+    module is imported, so a process that runs past midnight (or a 
+    module imported long before it's used) gets the right day.
+
+    Parameters
+    -----–-----------
+    days_ago: int
+        How many days back to go (i.e. 1 for yesterday)
+    """
+    return (datetime.date.today() - datetime.timedelta(days = days_ago)).strftime("%m/%d/%Y")
+
+def partition_path(gameday):
+    """
+    Returns the path of the Parquet file holding a day's rows.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day of the partition (i.e. "08/20/2019")
+    """
+    return os.path.join(FEATURE_STORE_DIR, "date={}".format(to_date(gameday).isoformat()), "part-0.parquet")
+
+def conform_to_schema(player_stats_table):
+    """
+    Returns a copy of a player stats dataframe with exactly the columns
+    in STORE_SCHEMA, in order. Missing feature columns are filled with
+    NaN, a missing label column with nulls (for test data), and columns
+    that aren't in the schema are dropped.
+
+    Parameters
+    -----–-----------
+    player_stats_table: pd.DataFrame
+        Rows of player stats, as generated by retrieve_data.py
+    """
+    table = player_stats_table.copy()
+    for column in FEATURE_COLUMNS:
+        if column not in table:
+            table[column] = float("nan")
+    if LABEL_COLUMN not in table:
+        table[LABEL_COLUMN] = None
+    for column in FEATURE_COLUMNS:
+        table[column] = pd.to_numeric(table[column], errors="coerce").astype("float64")
+    return table[STORE_SCHEMA.names]
+
+@instrumentation.traced('storage')
+def write_partition(player_stats_table, gameday):
+    """
+    Writes a day's rows to the feature store, replacing any rows already
+    stored for that day. The file is written under a temporary name and
+    then renamed, so readers never see a half-written partition. Returns
+    the path of the partition.
+
+    Parameters
+    -----–-----------
+    player_stats_table: pd.DataFrame
+        The day's rows of player stats.
+
+    gameday: str or datetime.date
+        The day the rows are for (i.e. "08/20/2019")
+    """
+    path = partition_path(gameday)
+    table = pa.Table.from_pandas(conform_to_schema(player_stats_table), schema=STORE_SCHEMA, preserve_index=False)
+    with atomic_files.replace_path(path) as tmp_path:
+        pq.write_table(table, tmp_path)
+    return path
+
+def list_dates(labeled_only=False):
+    """
+    Returns a sorted list of every day (as datetime.date) that has a
+    partition in the feature store.
+
+    Parameters
+    -----–-----------
+    labeled_only: bool
+        Only include days whose rows have the player_got_hit label,
+        i.e. training data rather than test data.
+    """
+    dates = []
+    for path in glob.glob(os.path.join(FEATURE_STORE_DIR, "date=*", "part-0.parquet")):
+        if labeled_only:
+            labels = pq.read_table(path, columns=[LABEL_COLUMN])[LABEL_COLUMN]
+            if len(labels) == 0 or labels.null_count == len(labels):
+                continue
+        partition = os.path.basename(os.path.dirname(path))
+        dates.append(datetime.datetime.strptime(partition[len("date="):], "%Y-%m-%d").date())
+    return sorted(dates)
+
+@instrumentation.traced('storage')
+def read_range(start_date=None, end_date=None, columns=None):
+    """
+    Reads rows from the feature store into a dataframe. Only partitions
+    between start_date and end_date are opened, only the requested
+    columns are read, and the files are memory-mapped rather than
+    copied into memory. Rows are sorted by date, and include a 'date'
+    column.
+
+    Parameters
+    -----–-----------
+    start_date, end_date: str or datetime.date
+        The first and last days to read (inclusive). Leave either one
+        out to read from the beginning or up to the end of the store.
+
+    columns: list of str
+        The columns to read. Defaults to every column.
+    """
+    dataset = ds.dataset(FEATURE_STORE_DIR, format="parquet", partitioning=PARTITIONING,
+                         filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+
+    date_filter = None
+    if start_date is not None:
+        date_filter = ds.field('date') >= pa.scalar(to_date(start_date), pa.date32())
+    if end_date is not None:
+        end_filter = ds.field('date') <= pa.scalar(to_date(end_date), pa.date32())
+        date_filter = end_filter if date_filter is None else date_filter & end_filter
+
+    if columns is not None and 'date' not in columns:
+        columns = list(columns) + ['date']
+
+    table = dataset.to_table(columns=columns, filter=date_filter)
+    return table.to_pandas().sort_values('date', kind="stable").reset_index(drop=True)
+
+@instrumentation.traced('storage')
+def read_partition(gameday, columns=None):
+    """
+    Reads a single day's rows from the feature store, without the
+    'date' column.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day to read (i.e. "08/20/2019")
+
+    columns: list of str
+        The columns to read. Defaults to every column.
+    """
+    return pq.read_table(partition_path(gameday), columns=columns, memory_map=True).to_pandas()
+
+################################################## STAGED PARTITIONS ##############################################################
+
+# Rows are staged one game at a time while a day is being generated, so
+# an interrupted run can pick up where it left off:
+#
+#     data/staging/date=2019-08-20/game_567104.parquet
+#     data/staging/date=2019-08-20/manifest.json
+#
+# manifest.json lists the games whose rows are staged. Once every game is
+# in it, the staged files are combined into the day's partition and the
+# staging directory is removed.
+STAGING_DIR = "data/staging"
+
+def staging_dir(gameday):
+    return os.path.join(STAGING_DIR, "date={}".format(to_date(gameday).isoformat()))
+
+@instrumentation.traced('storage')
+def stage_game(player_stats_table, gameday, game_id):
+    """
+    Writes one game's rows to the day's staging directory. The file is 
+    written under a temporary name and then renamed, so it's safe to call
+    from any process. Returns the path of the staged file.
+
+    Parameters
+    -----–-----------
+    player_stats_table: pd.DataFrame
+        The game's rows of player stats.
+
+    gameday: str or datetime.date
+        The day of the game (i.e. "08/20/2019")
+
+    game_id: int
+        The 6-digit ID of the game.
+    """
+    path = os.path.join(staging_dir(gameday), "game_{}.parquet".format(game_id))
+    table = pa.Table.from_pandas(conform_to_schema(player_stats_table), schema=STORE_SCHEMA, preserve_index=False)
+    with atomic_files.replace_path(path) as tmp_path:
+        pq.write_table(table, tmp_path)
+    return path
+
+class StagedPartition:
+    """
+    Tracks which games of a day have been staged (see stage_game), using
+    the day's manifest, and combines them into the day's partition once 
+    they're all done. Only one process should use a day's StagedPartition
+    at a time; workers in other processes can still call stage_game().
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day being generated (i.e. "08/20/2019")
+
+    labeled: bool
+        Whether the rows being staged have labels. Staged games from an
+        earlier run of the other kind (i.e. test rows when generating
+        training rows) are thrown away.
+    """
+
+    def __init__(self, gameday, labeled=True):
+        self.gameday = to_date(gameday)
+        self.labeled = labeled
+        self.dir = staging_dir(gameday)
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self.completed = set()
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest['labeled'] == labeled:
+                self.completed = set(manifest['completed_games'])
+            else:
+                shutil.rmtree(self.dir)
+
+    def add(self, game_id):
+        """
+        Records a game as staged, once its rows have been written with 
+        stage_game(). The manifest is rewritten atomically.
+        """
+        self.completed.add(game_id)
+        with atomic_files.replace_file(self.manifest_path) as f:
+            json.dump({'date': self.gameday.isoformat(), 'labeled': self.labeled, 
+                       'completed_games': sorted(self.completed)}, f)
+
+    def row_count(self, game_id):
+        """
+        Returns the number of rows staged for a game, from its file's 
+        metadata.
+        """
+        return pq.read_metadata(os.path.join(self.dir, "game_{}.parquet".format(game_id))).num_rows
+
+    def finalize(self, game_ids):
+        """
+        Combines the staged games into the day's partition, in the order
+        given, and removes the staging directory. Games are copied one at
+        a time into a temporary file that's renamed when complete, so
+        memory use doesn't grow with the size of the slate. Returns the
+        path of the partition.
+
+        Parameters
+        -----–-----------
+        game_ids: list of int
+            Every game on the day, in the order their rows should appear.
+        """
+        game_ids = list(OrderedDict.fromkeys(game_ids))
+        missing = [game_id for game_id in game_ids if game_id not in self.completed]
+        if missing:
+            raise ValueError("Games {} on {} haven't been staged".format(missing, self.gameday))
+
+        path = partition_path(self.gameday)
+        with atomic_files.replace_path(path) as tmp_path:
+            with pq.ParquetWriter(tmp_path, STORE_SCHEMA) as writer:
+                for game_id in game_ids:
+                    writer.write_table(pq.read_table(os.path.join(self.dir, "game_{}.parquet".format(game_id))))
+        shutil.rmtree(self.dir, ignore_errors=True)
+        return path
+
+def migrate_csvs(csv_dir="data/player_stats"):
+    """
+    Copies every player_stats CSV into the feature store, one partition
+    per file. Older files whose columns differ from the current schema
+    are conformed to it (see conform_to_schema), and labels that can't
+    be read as True/False are stored as nulls.
+
+    Parameters
+    -----–-----------
+    csv_dir: str
+        The directory holding the player_stats_MM_DD_YYYY.csv files.
+    """
+    for csv_file in sorted(glob.glob(os.path.join(csv_dir, "player_stats_*.csv"))):
+        gameday = to_date(os.path.basename(csv_file)[-14:-4])
+        player_stats_table = pd.read_csv(csv_file)
+        if LABEL_COLUMN in player_stats_table:
+            labels = player_stats_table[LABEL_COLUMN].map({True: True, False: False, 'True': True, 'False': False})
+            player_stats_table[LABEL_COLUMN] = labels.astype(object).where(labels.notna(), None)
+        print("Migrated {} -> {}".format(csv_file, write_partition(player_stats_table, gameday)))
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Manage the Parquet feature store in data/feature_store")
+    arg_parser.add_argument("--migrate", help = "Copy the CSVs in data/player_stats into the feature store", action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    if args.migrate:
+        migrate_csvs()
+
+if __name__ == "__main__":
+    main()
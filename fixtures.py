@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import time
+
+import atomic_files
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# Every MLB API request in retrieve_data.py goes through call_statsapi(),
+# which hands it to this module when recording or replaying:
+#
+#     MODE = None       requests go to the API as usual
+#     MODE = 'record'   requests go to the API, and each response is also
+#                       saved to the fixture set
+#     MODE = 'replay'   responses come from the fixture set, after
+#                       sleeping for LATENCY seconds (plus up to JITTER),
+#                       and the API is never called
+#
+# A fixture set is a directory with one gzipped JSON file per request:
+#
+#     data/fixtures/2019-09-15/3f2a...e1.json.gz
+#
+FIXTURE_DIR = "data/fixtures"
+MODE = None
+FIXTURE_SET = None
+LATENCY = 0.0
+JITTER = 0.0
+
+class MissingFixture(Exception):
+    """
+    Raised in replay mode for a request that wasn't recorded.
+    """
+
+def configure(mode=None, fixture_set=None, latency=0.0, jitter=0.0):
+    """
+    Turns recording or replaying on or off for this process.
+
+    Parameters
+    -----–-----------
+    mode: str
+        'record', 'replay', or None to use the API as usual.
+
+    fixture_set: str
+        The name of the fixture set (a directory in data/fixtures),
+        usually the day it was recorded (i.e. "2019-09-15")
+
+    latency, jitter: float
+        When replaying, each response is delayed by latency seconds plus
+        a random amount up to jitter seconds, to simulate the API.
+    """
+    global MODE, FIXTURE_SET, LATENCY, JITTER
+    if mode not in [None, 'record', 'replay']:
+        raise ValueError("Unknown fixture mode: {}".format(mode))
+    if mode is not None and not fixture_set:
+        raise ValueError("A fixture set name is needed to {}".format(mode))
+    MODE, FIXTURE_SET, LATENCY, JITTER = mode, fixture_set, latency, jitter
+
+def settings():
+    """
+    Returns this process's settings, in the order configure() takes
+    them, for passing to worker processes.
+    """
+    return MODE, FIXTURE_SET, LATENCY, JITTER
+
+def fixture_path(key):
+    """
+    Returns the path a request's response is saved under.
+
+    Parameters
+    -----–-----------
+    key: str
+        The request, as serialized by retrieve_data.request_key().
+    """
+    file_name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json.gz"
+    return os.path.join(FIXTURE_DIR, FIXTURE_SET, file_name)
+
+def record(key, response):
+    """
+    Saves a response to the fixture set. The file is written under a
+    temporary name and then renamed, so it's safe to call from any
+    thread or process.
+    """
+    with atomic_files.replace_path(fixture_path(key)) as tmp_path:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({'request': key, 'response': response}, f)
+
+def replay(key):
+    """
+    Returns a recorded response, after the simulated latency. Raises
+    MissingFixture if the request wasn't recorded.
+    """
+    path = fixture_path(key)
+    if not os.path.exists(path):
+        raise MissingFixture("No response recorded in fixture set {} for {}".format(FIXTURE_SET, key))
+    if LATENCY or JITTER:
+        time.sleep(LATENCY + random.uniform(0, JITTER))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)['response']
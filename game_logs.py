@@ -0,0 +1,274 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.fs
+
+import datetime
+import glob
+import os
+
+import argparse
+
+import atomic_files
+import instrumentation
+from feature_store import PARTITIONING, to_date
+
+################################################## GAME LOG STORE #################################################################
+
+# Every player's line from every game, taken from the boxscores, in one
+# hive-style date partition per day for each stat group:
+#
+#     data/game_logs/hitting/date=2019-08-20/part-0.parquet
+#     data/game_logs/pitching/date=2019-08-20/part-0.parquet
+#
+# Past N game stats for any N are computed from these counts, so they
+# don't need a request per player per window.
+GAME_LOG_DIR = "data/game_logs"
+
+HITTING_COUNTS = ['atBats', 'hits', 'doubles', 'triples', 'homeRuns', 'baseOnBalls', 'intentionalWalks',
+                  'hitByPitch', 'sacFlies', 'plateAppearances', 'totalBases', 'strikeOuts']
+PITCHING_COUNTS = ['outs', 'battersFaced', 'atBats', 'hits', 'runs', 'earnedRuns', 'homeRuns', 'baseOnBalls',
+                   'strikeOuts', 'hitByPitch', 'numberOfPitches', 'strikes', 'stolenBases', 'caughtStealing',
+                   'groundOuts', 'airOuts', 'wins', 'losses']
+COUNTS = {'hitting': HITTING_COUNTS, 'pitching': PITCHING_COUNTS}
+
+def log_schema(group):
+    return pa.schema([('ID', pa.int64()), ('game_id', pa.int64())]
+                     + [(count, pa.int64()) for count in COUNTS[group]])
+
+def log_path(group, gameday):
+    return os.path.join(GAME_LOG_DIR, group, "date={}".format(to_date(gameday).isoformat()), "part-0.parquet")
+
+def innings_to_outs(innings_pitched):
+    """
+    Converts innings pitched as the API writes them (i.e. "6.1" for six
+    and a third innings) to outs recorded.
+    """
+    whole, _, thirds = str(innings_pitched or "0").partition(".")
+    return 3 * int(whole or 0) + int(thirds or 0)
+
+def boxscore_lines(boxscore, game_id):
+    """
+    Pulls every player's hitting and pitching line out of a game's
+    boxscore. Returns two dataframes (hitting and pitching) with one row
+    per player who batted or pitched, and the columns in log_schema().
+
+    Parameters
+    -----–-----------
+    boxscore: dict
+        The game's boxscore (the 'liveData' -> 'boxscore' part of a
+        `game` response).
+
+    game_id: int
+        The 6-digit ID of the game.
+    """
+    lines = {'hitting': [], 'pitching': []}
+    for home_or_away in ['home', 'away']:
+        for player_key, player in boxscore['teams'][home_or_away]['players'].items():
+            player_id = int(player_key.replace('ID', ''))
+            batting = player.get('stats', {}).get('batting', {})
+            pitching = player.get('stats', {}).get('pitching', {})
+            if batting.get('plateAppearances', batting.get('atBats')) is not None:
+                lines['hitting'].append([player_id, game_id] + [int(batting.get(count) or 0) for count in HITTING_COUNTS])
+            if pitching.get('inningsPitched') is not None:
+                pitching = dict(pitching, outs=innings_to_outs(pitching['inningsPitched']))
+                lines['pitching'].append([player_id, game_id] + [int(pitching.get(count) or 0) for count in PITCHING_COUNTS])
+    return tuple(pd.DataFrame(lines[group], columns=log_schema(group).names) for group in ['hitting', 'pitching'])
+
+@instrumentation.traced('storage')
+def write_day(group, gameday, lines):
+    """
+    Writes a day's lines for one stat group, replacing any lines already
+    stored for that day. The file is written under a temporary name and
+    then renamed. Returns the path of the partition.
+
+    Parameters
+    -----–-----------
+    group: str
+        'hitting' or 'pitching'
+
+    gameday: str or datetime.date
+        The day the games were played (i.e. "08/20/2019")
+
+    lines: pd.DataFrame
+        Lines from boxscore_lines() for every game that day.
+    """
+    path = log_path(group, gameday)
+    table = pa.Table.from_pandas(lines[log_schema(group).names].astype("int64"), schema=log_schema(group),
+                                 preserve_index=False)
+    with atomic_files.replace_path(path) as tmp_path:
+        pq.write_table(table, tmp_path)
+    return path
+
+def list_dates(group="hitting"):
+    """
+    Returns a sorted list of every day (as datetime.date) that has game
+    logs stored for a stat group.
+    """
+    partitions = glob.glob(os.path.join(GAME_LOG_DIR, group, "date=*", "part-0.parquet"))
+    return sorted(datetime.datetime.strptime(os.path.basename(os.path.dirname(path))[len("date="):], "%Y-%m-%d").date()
+                  for path in partitions)
+
+@instrumentation.traced('storage')
+def read_logs(group, start_date=None, before=None):
+    """
+    Reads game logs for a stat group, memory-mapped, sorted by player,
+    date and game. Includes a 'date' column.
+
+    Parameters
+    -----–-----------
+    group: str
+        'hitting' or 'pitching'
+
+    start_date: str or datetime.date
+        The first day to read. Defaults to the beginning of the store.
+
+    before: str or datetime.date
+        Only read games played before this day.
+    """
+    group_dir = os.path.join(GAME_LOG_DIR, group)
+    if not os.path.isdir(group_dir):
+        return pd.DataFrame(columns=log_schema(group).names + ['date'])
+    dataset = ds.dataset(group_dir, format="parquet", partitioning=PARTITIONING,
+                         filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+
+    date_filter = None
+    if start_date is not None:
+        date_filter = ds.field('date') >= pa.scalar(to_date(start_date), pa.date32())
+    if before is not None:
+        before_filter = ds.field('date') < pa.scalar(to_date(before), pa.date32())
+        date_filter = before_filter if date_filter is None else date_filter & before_filter
+
+    logs = dataset.to_table(filter=date_filter).to_pandas()
+    return logs.sort_values(['ID', 'date', 'game_id'], kind="stable").reset_index(drop=True)
+
+################################################## ROLLING WINDOWS ################################################################
+
+def ratio(numerator, denominator, scale=1.0):
+    # Rates with nothing to divide by are 0.0, the same as the API's
+    # ".---" placeholders after parse_stat()
+    numerator, denominator = np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, scale * numerator / denominator, 0.0)
+
+def hitting_rates(sums):
+    """
+    Computes the PAST_N_HITTING_STATS columns from summed hitting counts,
+    the way the API computes them for lastXGames.
+    """
+    avg = ratio(sums['hits'], sums['atBats'])
+    obp = ratio(sums['hits'] + sums['baseOnBalls'] + sums['hitByPitch'],
+                sums['atBats'] + sums['baseOnBalls'] + sums['hitByPitch'] + sums['sacFlies'])
+    slg = ratio(sums['totalBases'], sums['atBats'])
+    return pd.DataFrame({'atBatsPerHomeRun': ratio(sums['atBats'], sums['homeRuns']), 'avg': avg,
+                         'hits': sums['hits'].astype(float), 'obp': obp, 'ops': obp + slg, 'slg': slg},
+                        index=sums.index)
+
+def pitching_rates(sums):
+    """
+    Computes the PAST_N_PITCHING_STATS columns from summed pitching
+    counts, the way the API computes them for lastXGames. Innings pitched
+    are written the API's way (i.e. 6.1 for six and a third).
+    """
+    innings = sums['outs'] / 3
+    return pd.DataFrame({'avg': ratio(sums['hits'], sums['atBats']),
+                         'era': ratio(sums['earnedRuns'], innings, 9),
+                         'groundOutsToAirouts': ratio(sums['groundOuts'], sums['airOuts']),
+                         'hitsPer9Inn': ratio(sums['hits'], innings, 9),
+                         'homeRunsPer9': ratio(sums['homeRuns'], innings, 9),
+                         'inningsPitched': (sums['outs'] // 3 + (sums['outs'] % 3) / 10).astype(float),
+                         'pitchesPerInning': ratio(sums['numberOfPitches'], innings),
+                         'runsScoredPer9': ratio(sums['runs'], innings, 9),
+                         'stolenBasePercentage': ratio(sums['stolenBases'], sums['stolenBases'] + sums['caughtStealing']),
+                         'strikePercentage': ratio(sums['strikes'], sums['numberOfPitches']),
+                         'strikeoutWalkRatio': ratio(sums['strikeOuts'], sums['baseOnBalls']),
+                         'strikeoutsPer9Inn': ratio(sums['strikeOuts'], innings, 9),
+                         'walksPer9Inn': ratio(sums['baseOnBalls'], innings, 9),
+                         'whip': ratio(sums['baseOnBalls'] + sums['hits'], innings),
+                         'winPercentage': ratio(sums['wins'], sums['wins'] + sums['losses'])},
+                        index=sums.index)
+
+RATES = {'hitting': hitting_rates, 'pitching': pitching_rates}
+
+def rolling_sums(logs, group, n):
+    """
+    Returns, for every row of a stat group's game logs, the player's
+    counts summed over that game and the n - 1 games before it. Computed
+    for every player at once from cumulative sums, so the cost doesn't
+    depend on n.
+
+    Parameters
+    -----–-----------
+    logs: pd.DataFrame
+        Game logs from read_logs(), sorted by player, date and game.
+
+    group: str
+        'hitting' or 'pitching'
+
+    n: int
+        The number of games in the window.
+    """
+    counts = logs[COUNTS[group]].to_numpy(dtype=np.int64)
+    player_ids = logs['ID'].to_numpy()
+
+    cumulative = np.cumsum(counts, axis=0)
+    # Position of each row within its player's games
+    player_start = np.r_[True, player_ids[1:] != player_ids[:-1]]
+    start_index = np.maximum.accumulate(np.where(player_start, np.arange(len(logs)), 0))
+    game_number = np.arange(len(logs)) - start_index
+
+    # The window starts n - 1 rows back, or at the player's first game
+    window_start = np.arange(len(logs)) - np.minimum(game_number, n - 1)
+    before_window = np.where(window_start > 0, window_start - 1, 0)
+    sums = cumulative - np.where((window_start > 0)[:, np.newaxis], cumulative[before_window], 0)
+    return pd.DataFrame(sums, columns=COUNTS[group], index=logs.index)
+
+@instrumentation.traced('feature')
+def past_n_games(group, windows, gameday, logs=None):
+    """
+    Returns each player's past N game stats, as of the start of a day,
+    for every window N. Returns a dictionary mapping each N to a
+    dataframe indexed by player ID, with the same stats (and names) as
+    the API's lastXGames. Players with no stored games aren't included.
+
+    Parameters
+    -----–-----------
+    group: str
+        'hitting' or 'pitching'
+
+    windows: list of int
+        The window sizes (i.e. [7, 15])
+
+    gameday: str or datetime.date
+        Only games played before this day are counted.
+
+    logs: pd.DataFrame
+        Game logs already read with read_logs(group, before=gameday).
+    """
+    if logs is None:
+        logs = read_logs(group, before=gameday)
+    last_games = ~logs['ID'].duplicated(keep='last')
+
+    tables = {}
+    for n in windows:
+        sums = rolling_sums(logs, group, n)[last_games.values]
+        sums.index = logs.loc[last_games.values, 'ID'].values
+        tables[n] = RATES[group](sums)
+    return tables
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Inspect the game logs in {}".format(GAME_LOG_DIR))
+    arg_parser.add_argument("--player", help = "Player ID to show past N game stats for", type=int, required=True)
+    arg_parser.add_argument("--group", help = "hitting or pitching (default: hitting)", default="hitting")
+    arg_parser.add_argument("--windows", help = "Window sizes (default: 3 7 15 30)", type=int, nargs="+",
+                            default=[3, 7, 15, 30])
+    args = arg_parser.parse_args(argv)
+
+    tables = past_n_games(args.group, args.windows, datetime.date.today() + datetime.timedelta(days = 1))
+    print(pd.DataFrame({"p{}G".format(n): table.loc[args.player] for n, table in tables.items()
+                        if args.player in table.index}))
+
+if __name__ == "__main__":
+    main()
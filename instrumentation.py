@@ -0,0 +1,228 @@
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+
+import atomic_files
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# Tracing is off unless a script is run with --profile, and costs one
+# check per call when it's off.
+ENABLED = False
+PROFILE_DIR = "data/profiles"
+METRIC_PREFIX = "beat_the_streak"
+
+# Upper bounds (in seconds) of the latency histogram buckets, as in a
+# Prometheus histogram. Every call also counts toward +Inf.
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+################################################## TRACER #########################################################################
+
+class Tracer:
+    """
+    Thread-safe record of every traced call in a run, grouped by kind
+    (i.e. 'statsapi', 'feature', 'stage') and name (i.e. 'people',
+    'get_game_matchups'). For each one it keeps the number of calls,
+    errors, total and histogram of latencies, response bytes and cache
+    hits and misses.
+
+    Times are inclusive: a feature function's time includes the statsapi
+    calls it makes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def entry(self, kind, name):
+        # Callers must hold self.lock
+        key = (kind, name)
+        if key not in self.stats:
+            self.stats[key] = {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                               'buckets': [0] * len(LATENCY_BUCKETS), 'bytes': 0,
+                               'cache_hits': 0, 'cache_misses': 0}
+        return self.stats[key]
+
+    def record_call(self, kind, name, seconds, error=False):
+        with self.lock:
+            stats = self.entry(kind, name)
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            for i, upper_bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper_bound:
+                    stats['buckets'][i] += 1
+                    break
+
+    def record_bytes(self, kind, name, n_bytes):
+        with self.lock:
+            self.entry(kind, name)['bytes'] += n_bytes
+
+    def record_cache(self, kind, name, hit):
+        with self.lock:
+            self.entry(kind, name)['cache_hits' if hit else 'cache_misses'] += 1
+
+    def snapshot(self, reset=False):
+        """
+        Returns a JSON-serializable copy of the stats, for sending back
+        from a worker process (see merge). If reset is True, the stats
+        are cleared.
+        """
+        with self.lock:
+            snapshot = [[kind, name, dict(stats, buckets=list(stats['buckets']))]
+                        for (kind, name), stats in self.stats.items()]
+            if reset:
+                self.stats = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        Adds the stats from another tracer's snapshot to this one.
+        """
+        with self.lock:
+            for kind, name, other in snapshot:
+                stats = self.entry(kind, name)
+                for field in ['calls', 'errors', 'seconds', 'bytes', 'cache_hits', 'cache_misses']:
+                    stats[field] += other[field]
+                stats['max_seconds'] = max(stats['max_seconds'], other['max_seconds'])
+                stats['buckets'] = [a + b for a, b in zip(stats['buckets'], other['buckets'])]
+
+tracer = Tracer()
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+class trace:
+    """
+    Context manager that times a block of code and records it with the
+    tracer under the given kind and name, i.e.
+
+        with instrumentation.trace('stage', 'hyperparameter search'):
+            ...
+    """
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if ENABLED:
+            tracer.record_call(self.kind, self.name, time.perf_counter() - self.start, error=exc_type is not None)
+        return False
+
+def traced(kind):
+    """
+    Decorator that records every call to a function with the tracer,
+    under the given kind and the function's name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with trace(kind, func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_bytes(kind, name, n_bytes):
+    if ENABLED:
+        tracer.record_bytes(kind, name, n_bytes)
+
+def record_cache(kind, name, hit):
+    if ENABLED:
+        tracer.record_cache(kind, name, hit)
+
+################################################## REPORTS ########################################################################
+
+def summary_table():
+    """
+    Returns the traced calls as a text table, slowest total time first.
+    """
+    lines = ["{:<9} {:<32} {:>7} {:>9} {:>9} {:>9} {:>11} {:>9}".format(
+        "kind", "name", "calls", "total s", "mean ms", "max ms", "bytes", "cache hit")]
+    for kind, name, stats in sorted(tracer.snapshot(), key=lambda s: -s[2]['seconds']):
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        lines.append("{:<9} {:<32} {:>7} {:>9.2f} {:>9.1f} {:>9.1f} {:>11} {:>9}".format(
+            kind, name, stats['calls'], stats['seconds'],
+            1000 * stats['seconds'] / stats['calls'] if stats['calls'] else 0.0,
+            1000 * stats['max_seconds'], stats['bytes'],
+            "{:.0%}".format(stats['cache_hits'] / lookups) if lookups else "-"))
+    return "\n".join(lines)
+
+def prometheus_text(run_name):
+    """
+    Returns the traced calls in the Prometheus text exposition format,
+    for the node exporter's textfile collector.
+
+    Parameters
+    -----–-----------
+    run_name: str
+        Added to every metric as the 'run' label (i.e. "retrieve_data")
+    """
+    metric = METRIC_PREFIX + "_call_seconds"
+    lines = ["# HELP {} Time spent in traced calls.".format(metric), "# TYPE {} histogram".format(metric)]
+    counters = {'errors': "Traced calls that raised an exception.",
+                'bytes': "Bytes in API responses.",
+                'cache_hits': "Response cache hits.",
+                'cache_misses': "Response cache misses."}
+    snapshot = tracer.snapshot()
+
+    for kind, name, stats in snapshot:
+        labels = 'run="{}",kind="{}",name="{}"'.format(run_name, kind, name)
+        cumulative = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, upper_bound, cumulative))
+        lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(metric, labels, stats['calls']))
+        lines.append('{}_sum{{{}}} {}'.format(metric, labels, stats['seconds']))
+        lines.append('{}_count{{{}}} {}'.format(metric, labels, stats['calls']))
+
+    for field, help_text in counters.items():
+        counter = "{}_{}_total".format(METRIC_PREFIX, field)
+        lines += ["# HELP {} {}".format(counter, help_text), "# TYPE {} counter".format(counter)]
+        for kind, name, stats in snapshot:
+            lines.append('{}{{run="{}",kind="{}",name="{}"}} {}'.format(counter, run_name, kind, name, stats[field]))
+    return "\n".join(lines) + "\n"
+
+def write_report(run_name):
+    """
+    Writes the run's traces to data/profiles as a JSON report and a
+    Prometheus textfile, prints the summary table, and returns the paths
+    of both files:
+
+        data/profiles/retrieve_data_2019-09-17T08-00-00.json
+        data/profiles/retrieve_data.prom
+
+    The textfile keeps the same name from run to run, so a collector
+    always picks up the latest run.
+
+    Parameters
+    -----–-----------
+    run_name: str
+        The name of the script being profiled (i.e. "retrieve_data")
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    finished_at = datetime.datetime.now().isoformat(timespec="seconds")
+    json_file = os.path.join(PROFILE_DIR, "{}_{}.json".format(run_name, finished_at.replace(":", "-")))
+    prom_file = os.path.join(PROFILE_DIR, "{}.prom".format(run_name))
+
+    report = {'run': run_name, 'finished_at': finished_at, 'latency_buckets': LATENCY_BUCKETS,
+              'calls': [dict(stats, kind=kind, name=name) for kind, name, stats in tracer.snapshot()]}
+    with open(json_file, "w") as f:
+        json.dump(report, f, indent=1)
+    with atomic_files.replace_file(prom_file) as f:
+        f.write(prometheus_text(run_name))
+
+    print(summary_table())
+    print("Profile written to {} and {}".format(json_file, prom_file))
+    return json_file, prom_file
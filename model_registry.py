@@ -0,0 +1,135 @@
+import joblib
+
+import datetime
+import json
+import os
+
+import atomic_files
+import instrumentation
+
+################################################## MODEL REGISTRY #################################################################
+
+# Fitted models are saved once per training day, one uncompressed joblib
+# file per model so their arrays can be memory-mapped when loaded:
+#
+#     data/models/2019-08-20/random_forests.joblib
+#
+# registry.json lists every version along with its best model and the
+# metadata it was trained with, and points to the current version.
+MODEL_DIR = "data/models"
+REGISTRY_FILE = os.path.join(MODEL_DIR, "registry.json")
+
+def read_registry():
+    """
+    Returns the contents of registry.json, or an empty registry if
+    nothing has been saved yet.
+    """
+    if not os.path.exists(REGISTRY_FILE):
+        return {'current': None, 'versions': {}}
+    with open(REGISTRY_FILE) as f:
+        return json.load(f)
+
+def write_registry(registry):
+    # Written to a temporary file and renamed, so a predict run never
+    # reads a half-written registry.
+    with atomic_files.replace_file(REGISTRY_FILE) as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+
+def model_file_name(model_name):
+    """
+    Returns the file name a model is saved under, i.e.
+    "Random Forests" -> "random_forests.joblib"
+    """
+    return model_name.lower().replace(" ", "_") + ".joblib"
+
+@instrumentation.traced('storage')
+def save_models(models, version, best_model, metadata=None):
+    """
+    Saves a set of fitted models as a new version in the registry and
+    makes it the current version. Saving a version that already exists
+    replaces it. Returns the version.
+
+    Parameters
+    -----–-----------
+    models: dict
+        Maps each model's name to the fitted model.
+
+    version: str or datetime.date
+        The version to save under, usually the training day.
+
+    best_model: str
+        The name of the model predictions should use.
+
+    metadata: dict
+        Anything else worth keeping with the version (hyperparameters,
+        validation scores, feature columns, etc.). Must be JSON-serializable.
+    """
+    version = version.isoformat() if isinstance(version, datetime.date) else str(version)
+    version_dir = os.path.join(MODEL_DIR, version)
+    os.makedirs(version_dir, exist_ok=True)
+    for model_name, model in models.items():
+        path = os.path.join(version_dir, model_file_name(model_name))
+        with atomic_files.replace_path(path) as tmp_path:
+            joblib.dump(model, tmp_path)
+
+    registry = read_registry()
+    registry['versions'][version] = {'best_model': best_model,
+                                     'models': sorted(models.keys()),
+                                     'saved_at': datetime.datetime.now().isoformat(timespec="seconds"),
+                                     'metadata': metadata or {}}
+    registry['current'] = version
+    write_registry(registry)
+    return version
+
+@instrumentation.traced('storage')
+def load_model(model_name=None, version=None, mmap=True):
+    """
+    Loads a single model from the registry.
+
+    Parameters
+    -----–-----------
+    model_name: str
+        The model to load. Defaults to the version's best model.
+
+    version: str
+        The version to load from. Defaults to the current version.
+
+    mmap: bool
+        Memory-map the model's arrays instead of reading them into
+        memory. Memory-mapped arrays load almost instantly, but the 
+        models can't be trained further. Either way, the first model a
+        process loads imports sklearn, which takes about 1.5s.
+    """
+    registry = read_registry()
+    version = version or registry['current']
+    if version not in registry['versions']:
+        raise ValueError("No saved models for version {}".format(version))
+    model_name = model_name or registry['versions'][version]['best_model']
+    path = os.path.join(MODEL_DIR, version, model_file_name(model_name))
+    return joblib.load(path, mmap_mode="r" if mmap else None)
+
+def load_models(version=None, mmap=True):
+    """
+    Loads every model saved in a version. Returns a dictionary mapping
+    each model's name to the model.
+
+    Parameters
+    -----–-----------
+    version: str
+        The version to load. Defaults to the current version.
+
+    mmap: bool
+        See load_model().
+    """
+    registry = read_registry()
+    version = version or registry['current']
+    return {model_name: load_model(model_name, version, mmap)
+            for model_name in registry['versions'][version]['models']}
+
+def version_info(version=None):
+    """
+    Returns the registry entry (best model, model names, metadata) for a
+    version, defaulting to the current one.
+    """
+    registry = read_registry()
+    return registry['versions'][version or registry['current']]
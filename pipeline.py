@@ -0,0 +1,287 @@
+import atexit
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import argparse
+
+import atomic_files
+import feature_store
+import instrumentation
+import model_registry
+from publish import (day_file, PREDICTIONS_FILE, PAST_RESULTS_FILE, PERFORMANCE_FILE, ACCURACY_PLOT_FILE,
+                     SITE_INDEX_FILE)
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# The daily run, as a graph of stages. Each stage runs once everything it
+# depends on has finished, and up to MAX_PARALLEL_STAGES run at once in
+# this process, so the two feature builds (which mostly wait on the API)
+# overlap with each other and with training:
+#
+#     fetch-train-day ──┬── results ────────────┐
+#                       └── train ──┐           ├── publish
+#     fetch-test-day ───────────────┴── predict ┘
+#
+# publish only waits for results rather than depending on it, so today's
+# picks are still published when yesterday's results can't be generated.
+#
+# A stage is skipped when it's up to date: its key (a hash of the day,
+# the contents of its input files and, for fetch-test-day, the probable
+# pitchers and lineups on the live schedule) matches the key it last ran
+# with, and its output files are unchanged since. Keys, output hashes
+# and timings are kept in STATE_FILE.
+PIPELINE_DIR = "data/pipeline"
+STATE_FILE = os.path.join(PIPELINE_DIR, "state.json")
+MAX_PARALLEL_STAGES = 3
+
+################################################## STAGES #########################################################################
+
+# retrieve_data, train_model and predict are imported by the stages that
+# use them, so planning a run (i.e. --dry-run) only imports retrieve_data,
+# for the test day's schedule.
+
+def fetch_train_day(days):
+    import retrieve_data
+    retrieve_data.generate_hits_data(generate_train_data=True, gameday=days['train_day'])
+
+def fetch_test_day(days):
+    # Builds the day the first time, and after that only updates the games
+    # whose pitchers or lineups changed (the same as retrieve_data.py 
+    # --refresh, so the two don't undo each other's work)
+    import retrieve_data
+    retrieve_data.refresh_test_data(days['test_day'], rescore=False)
+
+def test_day_schedule(days):
+    import retrieve_data
+    return retrieve_data.schedule_signature(days['test_day'])
+
+def generate_results(days):
+    import retrieve_data
+    retrieve_data.generate_yesterdays_results(days['train_day'])
+
+def train(days):
+    import train_model
+    train_model.train_models(days['test_day'])
+
+def training_inputs(days):
+    import train_model
+    return [feature_store.partition_path(d) for d in train_model.training_dates(days['test_day'])]
+
+def predict_test_day(days):
+    import predict
+    predict.predict(days['test_day'])
+
+def publish_site(days):
+    import publish
+    publish.update_accuracy_plot(days['train_day'])
+    publish.publish_days([days['train_day'], days['test_day']])
+
+# Each stage maps to the stages it depends on, the function that runs it,
+# and functions returning its input and output files for the run's days.
+# A stage can also list stages to run 'after' without depending on them,
+# and a 'signature' function returning anything else its key depends on.
+# Stages are listed in an order that respects their dependencies.
+STAGES = OrderedDict([
+    ('fetch-train-day', {'deps': [], 'run': fetch_train_day,
+                         'inputs': lambda days: [],
+                         'outputs': lambda days: [feature_store.partition_path(days['train_day'])]}),
+    ('fetch-test-day', {'deps': [], 'run': fetch_test_day,
+                        'inputs': lambda days: [], 'signature': test_day_schedule,
+                        'outputs': lambda days: [feature_store.partition_path(days['test_day'])]}),
+    ('results', {'deps': ['fetch-train-day'], 'run': generate_results,
+                 'inputs': lambda days: [feature_store.partition_path(days['train_day']),
+                                         day_file(PREDICTIONS_FILE, days['train_day'])],
+                 'outputs': lambda days: [day_file(PAST_RESULTS_FILE, days['train_day'])]}),
+    ('train', {'deps': ['fetch-train-day'], 'run': train,
+               'inputs': training_inputs,
+               'outputs': lambda days: [model_registry.REGISTRY_FILE, day_file(PERFORMANCE_FILE, days['test_day'])]}),
+    ('predict', {'deps': ['train', 'fetch-test-day'], 'run': predict_test_day,
+                 'inputs': lambda days: [feature_store.partition_path(days['test_day']), model_registry.REGISTRY_FILE],
+                 'outputs': lambda days: [day_file(PREDICTIONS_FILE, days['test_day'])]}),
+    ('publish', {'deps': ['predict'], 'after': ['results'], 'run': publish_site,
+                 'inputs': lambda days: [day_file(pattern, day) for day in [days['train_day'], days['test_day']]
+                                         for pattern in [PREDICTIONS_FILE, PAST_RESULTS_FILE, PERFORMANCE_FILE]],
+                 'outputs': lambda days: [ACCURACY_PLOT_FILE, SITE_INDEX_FILE]}),
+])
+
+################################################## STATE ##########################################################################
+
+def file_hash(path):
+    """
+    Returns the SHA-1 of a file's contents, or None if it doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def stage_key(name, days):
+    """
+    Returns the key a stage runs with: a hash of its name, the run's days,
+    the contents of its input files and its signature, if it has one. It
+    changes whenever an input file or the signature does.
+    """
+    inputs = STAGES[name]['inputs'](days)
+    key_data = {'stage': name, 'days': days, 'inputs': {path: file_hash(path) for path in inputs}}
+    if 'signature' in STAGES[name]:
+        key_data['signature'] = STAGES[name]['signature'](days)
+    return hashlib.sha1(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def read_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def write_state(state):
+    with atomic_files.replace_file(STATE_FILE) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+def is_up_to_date(record, key):
+    """
+    Returns whether a stage's last run (its record in the state file)
+    used the same key and its outputs are all still there, unchanged.
+    """
+    return (record is not None and record['key'] == key
+            and all(output_hash is not None and file_hash(path) == output_hash
+                    for path, output_hash in record['outputs'].items()))
+
+################################################## ORCHESTRATOR ###################################################################
+
+def run_stage(name, days, record, force=False):
+    """
+    Runs one stage unless it's up to date. Returns a tuple of its status
+    ('done', 'skipped' or 'failed'), how long it took in seconds, and its
+    new record for the state file (None unless it ran successfully).
+    """
+    start = time.perf_counter()
+    try:
+        key = stage_key(name, days)
+        if not force and is_up_to_date(record, key):
+            return 'skipped', time.perf_counter() - start, None
+        with instrumentation.trace('stage', name):
+            STAGES[name]['run'](days)
+        # The key from before the run is recorded, so anything that changed
+        # while it ran (i.e. a lineup posted mid-fetch) makes it run again.
+        # No stage writes its own inputs.
+        new_record = {'key': key,
+                      'outputs': {path: file_hash(path) for path in STAGES[name]['outputs'](days)},
+                      'finished_at': datetime.datetime.now().isoformat(timespec="seconds")}
+        return 'done', time.perf_counter() - start, new_record
+    except Exception:
+        print("Stage {} failed:\n{}".format(name, traceback.format_exc()))
+        return 'failed', time.perf_counter() - start, None
+
+def run_pipeline(test_day=None, stages=None, force=(), max_parallel=MAX_PARALLEL_STAGES, dry_run=False):
+    """
+    Runs the daily pipeline (see STAGES) for a day's picks. Stages start
+    as soon as the stages they depend on are done or skipped (and the
+    stages they run after have finished either way), up to max_parallel
+    at a time. When a stage fails, the stages that depend on it are 
+    marked blocked and everything else still runs. Prints each
+    stage's status and time, and returns a dictionary mapping each stage
+    to its status.
+
+    Parameters
+    -----–-----------
+    test_day: str
+        The day to make picks for, in MM/DD/YYYY format. Defaults to
+        today. The day before it is the day whose games are fetched for
+        training and scored for the results page.
+
+    stages: list of str
+        The stages to run. Defaults to all of them. Stages that aren't
+        listed are treated as done.
+
+    force: list of str
+        Stages to run even if they're up to date ('all' for every stage).
+
+    max_parallel: int
+        The most stages to run at once.
+
+    dry_run: bool
+        Only print which stages would run or be skipped.
+    """
+    test_day = test_day or feature_store.current_day()
+    days = {'test_day': test_day,
+            'train_day': (feature_store.to_date(test_day) - datetime.timedelta(days = 1)).strftime("%m/%d/%Y")}
+    selected = [name for name in STAGES if stages is None or name in stages]
+    force = set(STAGES) if 'all' in force else set(force)
+    state = read_state()
+    state_key = feature_store.to_date(test_day).isoformat()
+    records = state.setdefault(state_key, {})
+
+    if dry_run:
+        for name in selected:
+            up_to_date = name not in force and is_up_to_date(records.get(name), stage_key(name, days))
+            print("{:<16} {}".format(name, "up to date" if up_to_date else "would run"))
+        return {}
+
+    statuses, timings = OrderedDict(), {}
+    pending = list(selected)
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                dep_statuses = [statuses.get(dep) for dep in STAGES[name]['deps'] if dep in selected]
+                after_statuses = [statuses.get(stage) for stage in STAGES[name].get('after', []) if stage in selected]
+                if any(status in ['failed', 'blocked'] for status in dep_statuses):
+                    statuses[name], timings[name] = 'blocked', 0.0
+                    pending.remove(name)
+                elif (all(status in ['done', 'skipped'] for status in dep_statuses)
+                      and all(status is not None for status in after_statuses)):
+                    print("Starting {}".format(name))
+                    running[executor.submit(run_stage, name, days, records.get(name), name in force)] = name
+                    pending.remove(name)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                statuses[name], timings[name], record = future.result()
+                print("Finished {}: {} in {:.1f}s".format(name, statuses[name], timings[name]))
+                if record is not None:
+                    records[name] = dict(record, seconds=round(timings[name], 3))
+                    write_state(state)
+
+    print("{:<16} {:>8} {:>9}".format("stage", "status", "seconds"))
+    for name in selected:
+        print("{:<16} {:>8} {:>9.1f}".format(name, statuses[name], timings[name]))
+    return statuses
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run the daily pipeline: fetch yesterday's and today's games, generate results, train, predict and publish")
+    arg_parser.add_argument("--date", help = "The day to make picks for, i.e. 09/16/2019 (default: today)")
+    arg_parser.add_argument("--stages", help = "Only run these stages (default: all of them)", nargs="+",
+                            choices=list(STAGES))
+    arg_parser.add_argument("--force", help = "Run these stages even if they're up to date, or 'all'", nargs="+",
+                            choices=list(STAGES) + ['all'], default=[])
+    arg_parser.add_argument("--parallel", help = "Most stages to run at once (default: {})".format(MAX_PARALLEL_STAGES),
+                            type=int, default=MAX_PARALLEL_STAGES)
+    arg_parser.add_argument("--dry-run", help = "Show which stages would run without running them", action="store_true")
+    arg_parser.add_argument("--profile", help = "Trace every stage, request and feature function and write a report to data/profiles",
+                            action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    if args.profile:
+        instrumentation.enable()
+        atexit.register(instrumentation.write_report, "pipeline")
+
+    statuses = run_pipeline(args.date, args.stages, args.force, args.parallel, args.dry_run)
+    if any(status in ['failed', 'blocked'] for status in statuses.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
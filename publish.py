@@ -0,0 +1,255 @@
+import pandas as pd
+import numpy as np
+
+import datetime
+import glob
+import json
+import os
+import re
+
+import argparse
+
+import atomic_files
+import feature_store
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# The files the website shows, one per day (see day_file)
+PREDICTIONS_FILE = "data/predictions/predictions_{}.csv"
+PAST_RESULTS_FILE = "data/past_results/past_results_{}.csv"
+PERFORMANCE_FILE = "data/model_stats/performance_{}.csv"
+ACCURACY_PLOT_FILE = "data/plots/accuracy_plot_data.csv"
+
+# Team names by team ID, so predictions can be published without asking
+# the API for them. Refresh it (--refresh-teams) when a team is renamed.
+TEAMS_FILE = "data/teams.json"
+
+# Everything the website shows, in one file it loads with one request:
+#
+#     {"days": {"2019-09-15": {"accuracy": {"overall": 0.7321, "top10": 0.6},
+#                              "performance": {"columns": [...], "rows": [...]},
+#                              "predictions": {"columns": [...], "rows": [...]},
+#                              "results": {"columns": [...], "rows": [...]}},
+#               ...},
+#      "latest": "2019-09-16", "version": 1}
+#
+# Days are keyed by ISO date and only the days being published are read
+# again, so a daily run adds to the index rather than rebuilding it. The
+# file is written compactly with sorted keys and rounded floats, so it's
+# byte-for-byte the same when nothing changed and compresses well.
+SITE_INDEX_FILE = "data/site/index.json"
+INDEX_VERSION = 1
+FLOAT_DIGITS = 4
+
+def day_file(pattern, gameday):
+    # Files named by day, like the website's (i.e. predictions_09_15_2019.csv)
+    return pattern.format(feature_store.to_date(gameday).strftime("%m_%d_%Y"))
+
+def write_json(path, data, **kwargs):
+    # Replaced in one step, so the website never sees a partial file
+    with atomic_files.replace_file(path) as f:
+        json.dump(data, f, sort_keys=True, **kwargs)
+
+################################################## TEAMS ##########################################################################
+
+def read_teams():
+    """
+    Returns the team table as a dictionary mapping team IDs (int) to
+    names.
+    """
+    with open(TEAMS_FILE) as f:
+        return {int(team_id): name for team_id, name in json.load(f).items()}
+
+def team_names(team_ids):
+    """
+    Returns the names of a list of teams from the team table. Teams that
+    aren't in it are named by their ID, with a warning.
+    """
+    teams = read_teams()
+    missing = sorted(set(int(team_id) for team_id in team_ids) - set(teams))
+    if missing:
+        print("Teams {} aren't in {}, run publish.py --refresh-teams".format(missing, TEAMS_FILE))
+    return [teams.get(int(team_id), str(team_id)) for team_id in team_ids]
+
+def refresh_teams(season=None):
+    """
+    Updates the team table with every MLB team's current name from the
+    API. Teams that are no longer listed keep their old names, so old
+    team IDs can still be looked up.
+
+    Parameters
+    -----–-----------
+    season: int
+        The season to list teams for. Defaults to this year.
+    """
+    import statsapi  # The only request publishing makes, and only when asked
+
+    season = season or datetime.date.today().year
+    teams = read_teams() if os.path.exists(TEAMS_FILE) else {}
+    teams.update({team['id']: team['name'] for team in statsapi.get('teams', {'sportId': 1, 'season': season})['teams']})
+    write_json(TEAMS_FILE, {str(team_id): name for team_id, name in teams.items()}, indent=1)
+    print("Wrote {} teams to {}".format(len(teams), TEAMS_FILE))
+
+################################################## ACCURACY PLOT ##################################################################
+
+def day_accuracy(gameday):
+    """
+    Returns a day's accuracy as a dictionary: the best model's validation
+    accuracy when it made the day's picks ('overall') and the share of
+    the day's top 10 that got a hit ('top10'). Returns None if the day's
+    results or model stats haven't been written yet.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day of the picks (i.e. "09/15/2019")
+    """
+    past_results_file, performance_file = day_file(PAST_RESULTS_FILE, gameday), day_file(PERFORMANCE_FILE, gameday)
+    if not os.path.exists(past_results_file) or not os.path.exists(performance_file):
+        return None
+    past_results = pd.read_csv(past_results_file)
+    top10 = float(past_results.loc[past_results['Name'] == 'Overall Accuracy', 'player_got_hit'].iloc[0])
+    overall = float(pd.read_csv(performance_file)['Accuracy'].max())
+    return {'overall': overall, 'top10': top10}
+
+def update_accuracy_plot(gameday):
+    """
+    Adds a day to the accuracy plot data on the website
+    (data/plots/accuracy_plot_data.csv), replacing the day's row if it's
+    already there (see day_accuracy). Does nothing if the day's results
+    haven't been generated yet (see
+    retrieve_data.generate_yesterdays_results).
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day of the picks (i.e. "09/15/2019")
+    """
+    accuracy = day_accuracy(gameday)
+    if accuracy is None:
+        print("No results for {} yet, not updating the accuracy plot".format(gameday))
+        return
+
+    accuracy_plot_data = pd.read_csv(ACCURACY_PLOT_FILE)
+    new_day = feature_store.to_date(gameday).strftime("%m/%d")
+    accuracy_plot_data = accuracy_plot_data[accuracy_plot_data['Day'] != new_day]
+    accuracy_plot_data = pd.concat([accuracy_plot_data, pd.DataFrame([{"Day": new_day,
+                                                                       "Overall Accuracy": accuracy['overall'],
+                                                                       "Top 10 Accuracy": accuracy['top10']}])],
+                                   ignore_index=True)
+    accuracy_plot_data.to_csv(ACCURACY_PLOT_FILE, index=False)
+
+################################################## SITE INDEX #####################################################################
+
+def round_value(value):
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), FLOAT_DIGITS)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def csv_table(path):
+    """
+    Reads one of the website's CSV files as a dictionary of its column
+    names and rows, without the unnamed index column older files have.
+    Returns None if the file doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    table = pd.read_csv(path)
+    table = table.loc[:, [not column.startswith("Unnamed") for column in table.columns]]
+    return {'columns': list(table.columns),
+            'rows': [[round_value(value) for value in row] for row in table.itertuples(index=False)]}
+
+def day_entry(gameday):
+    """
+    Returns everything the website shows for a day, as it's stored in the
+    site index: the day's predictions, results, model stats and accuracy,
+    leaving out whichever haven't been written. Returns None if none of
+    them have.
+
+    Parameters
+    -----–-----------
+    gameday: str or datetime.date
+        The day (i.e. "09/15/2019")
+    """
+    entry = {'predictions': csv_table(day_file(PREDICTIONS_FILE, gameday)),
+             'results': csv_table(day_file(PAST_RESULTS_FILE, gameday)),
+             'performance': csv_table(day_file(PERFORMANCE_FILE, gameday))}
+    if entry['results'] is not None:
+        # The accuracy is kept in 'accuracy' rather than as a row of the results
+        entry['results']['rows'] = [row for row in entry['results']['rows'] if row[0] != 'Overall Accuracy']
+    accuracy = day_accuracy(gameday)
+    if accuracy is not None:
+        entry['accuracy'] = {key: round_value(value) for key, value in accuracy.items()}
+    entry = {key: value for key, value in entry.items() if value is not None}
+    return entry or None
+
+def read_index():
+    if not os.path.exists(SITE_INDEX_FILE):
+        return {'days': {}, 'latest': None, 'version': INDEX_VERSION}
+    with open(SITE_INDEX_FILE) as f:
+        return json.load(f)
+
+def published_dates():
+    """
+    Returns every day (as datetime.date) that has a file for the website.
+    """
+    dates = set()
+    for pattern in [PREDICTIONS_FILE, PAST_RESULTS_FILE, PERFORMANCE_FILE]:
+        for path in glob.glob(pattern.format("*")):
+            match = re.search(r"(\d{2}_\d{2}_\d{4})\.csv$", path)
+            if match:
+                dates.add(datetime.datetime.strptime(match.group(1), "%m_%d_%Y").date())
+    return sorted(dates)
+
+def publish_days(dates, rebuild=False):
+    """
+    Updates the site index (see SITE_INDEX_FILE) with a list of days,
+    reading only those days' files. Days with no files are removed from
+    it. Returns the path of the index.
+
+    Parameters
+    -----–-----------
+    dates: list of str or datetime.date
+        The days to publish (i.e. ["09/15/2019", "09/16/2019"])
+
+    rebuild: bool
+        Start a new index instead of updating the current one.
+    """
+    index = {'days': {}} if rebuild else read_index()
+    for gameday in dates:
+        key = feature_store.to_date(gameday).isoformat()
+        entry = day_entry(gameday)
+        if entry is None:
+            index['days'].pop(key, None)
+        else:
+            index['days'][key] = entry
+
+    predicted_days = [key for key, entry in index['days'].items() if 'predictions' in entry]
+    index['latest'] = max(predicted_days) if predicted_days else None
+    index['version'] = INDEX_VERSION
+    write_json(SITE_INDEX_FILE, index, separators=(",", ":"))
+    return SITE_INDEX_FILE
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Publish the website's predictions, results and accuracy to {}".format(SITE_INDEX_FILE))
+    arg_parser.add_argument("--date", help = "The day of the picks to publish, along with the day before, i.e. 09/16/2019 (default: today)")
+    arg_parser.add_argument("--rebuild", help = "Rebuild the index from every day's files", action="store_true")
+    arg_parser.add_argument("--refresh-teams", help = "Update {} with the current team names from the API".format(TEAMS_FILE),
+                            action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    if args.refresh_teams:
+        refresh_teams()
+    if args.rebuild:
+        dates = published_dates()
+        publish_days(dates, rebuild=True)
+    else:
+        test_day = feature_store.to_date(args.date or feature_store.current_day())
+        dates = [test_day - datetime.timedelta(days = 1), test_day]
+        publish_days(dates)
+    print("Published {} days to {} ({} bytes)".format(len(dates), SITE_INDEX_FILE, os.path.getsize(SITE_INDEX_FILE)))
+
+if __name__ == "__main__":
+    main()
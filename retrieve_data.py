@@ -1,25 +1,539 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import statsapi
 import json
-import re
+import unicodedata
+import atexit
 import datetime
+import os
+import random
+import sqlite3
+import threading
+import time
 
 from tqdm import tqdm
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
-import sys
 import argparse
 
+import atomic_files
+import feature_store
+import fixtures
+import game_logs
+import instrumentation
+import publish
+from feature_store import (ID_COLUMNS, SEASON_HITTING_STATS, PAST_N_HITTING_STATS, PAST_N_PITCHING_STATS, 
+                           H2H_HITTING_STATS, FEATURE_COLUMNS, LABEL_COLUMN)
+
+# statsapi and requests are imported by the functions that make requests,
+# and predict only when --refresh re-scores the picks, so they aren't
+# loaded just by importing this module.
+
 ################################################## GLOBAL VARIABLES ###############################################################
 
-yesterday = (datetime.datetime.today() - datetime.timedelta(days = 1)).strftime("%m/%d/%Y")
-today = datetime.datetime.today().strftime("%m/%d/%Y")
+# Request settings for the concurrent fetch mode. These can be changed
+# from the command line with --workers and --rate-limit.
+STATSAPI_HOST = "statsapi.mlb.com"
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 10.0
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0
+
+# Games that are over, and can be backfilled.
+FINAL_GAME_STATUSES = ['Final', 'Game Over', 'Completed Early']
+
+# Past N game windows for the feature columns. When the game log store
+# has been started (see --game-logs), they're computed from it instead of
+# being requested from the API for every player.
+BATTING_WINDOWS = [7, 15]
+PITCHING_WINDOWS = [5]
+USE_GAME_LOGS = True
+
+# Probable pitchers and lineups each test partition was built with, so
+# --refresh can tell what changed since.
+SNAPSHOT_DIR = "data/snapshots"
+
+# On-disk cache of API responses, so reruns (and train/test runs on 
+# the same day) don't repeat requests. Turned off with --no-cache.
+USE_CACHE = True
+CACHE_PATH = "data/cache/statsapi_cache.sqlite"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# How long a cached response stays fresh, by endpoint class. None means
+# the response never changes, "end_of_day" means it expires at midnight.
+CACHE_TTLS = {
+    'immutable': None,       # completed boxscores, handedness
+    'daily': "end_of_day",   # season stats, lastXGames, h2h, rosters, name lookups
+    'live': 10 * 60,         # today's schedule, games still in progress
+}
+
+################################################## REQUEST HANDLING ###############################################################
+
+class RateLimiter:
+    """
+    A thread-safe token bucket that limits how many requests per second
+    are sent to a single host. Threads that find the bucket empty sleep
+    until a token is available.
+
+    Parameters 
+    -----–-----------
+    rate: float
+        The number of requests allowed per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(host):
+    """
+    Returns the RateLimiter for a host, creating it the first time 
+    the host is requested.
+
+    Parameters 
+    -----–-----------
+    host: str
+        The host name requests are sent to (i.e. "statsapi.mlb.com")
+    """
+    with rate_limiters_lock:
+        if host not in rate_limiters:
+            rate_limiters[host] = RateLimiter(REQUESTS_PER_SECOND)
+        return rate_limiters[host]
+
+def is_retryable(error):
+    """
+    Returns a bool indicating whether a failed request is worth retrying.
+    Connection errors (like the SSL resets in picks.log), timeouts, rate 
+    limiting and server errors are retried; other HTTP errors are not.
+
+    Parameters 
+    -----–-----------
+    error: requests.exceptions.RequestException
+        The exception raised by the failed request.
+    """
+    import requests
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status == 429 or (status is not None and status >= 500)
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def endpoint_name(func, args):
+    """
+    Returns the name a statsapi call is traced under: the endpoint for
+    statsapi.get (i.e. 'people'), otherwise the function's name (i.e. 
+    'schedule').
+    """
+    import statsapi
+    if func is statsapi.get and args:
+        return args[0]
+    return func.__name__
+
+def request_key(func, args, kwargs):
+    """
+    Serializes a statsapi call to a string that identifies it, for the 
+    response cache and recorded fixtures.
+    """
+    return json.dumps([func.__name__, args, kwargs], sort_keys=True, default=str)
+
+def call_statsapi(func, *args, **kwargs):
+    """
+    Calls a statsapi function (statsapi.get, statsapi.roster, etc.) 
+    through the per-host rate limiter, retrying with exponential backoff
+    when the request fails for a retryable reason. Every request made 
+    in this file should go through here.
+
+    When recording or replaying fixtures (see fixtures.py), responses are
+    also saved to, or served from, the fixture set. Replayed responses 
+    skip the rate limiter.
+
+    Parameters 
+    -----–-----------
+    func: function
+        The statsapi function to call (i.e. statsapi.get)
+
+    *args, **kwargs:
+        Passed through to func.
+    """
+    import requests
+    limiter = get_rate_limiter(STATSAPI_HOST)
+    endpoint = endpoint_name(func, args)
+    key = request_key(func, args, kwargs) if fixtures.MODE else None
+    for attempt in range(MAX_RETRIES + 1):
+        # Replays don't touch the API, so they aren't rate limited
+        if fixtures.MODE != 'replay':
+            limiter.acquire()
+        try:
+            with instrumentation.trace('statsapi', endpoint):
+                if fixtures.MODE == 'replay':
+                    response = fixtures.replay(key)
+                else:
+                    response = func(*args, **kwargs)
+            if fixtures.MODE == 'record':
+                fixtures.record(key, response)
+            if instrumentation.ENABLED:
+                instrumentation.record_bytes('statsapi', endpoint, len(json.dumps(response, default=str)))
+            return response
+        except requests.exceptions.RequestException as e:
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                raise
+            time.sleep(BACKOFF_SECONDS * (2 ** attempt) * random.uniform(1.0, 1.5))
+
+################################################## RESPONSE CACHE #################################################################
+
+class ResponseCache:
+    """
+    A size-bounded SQLite cache for API responses. Responses are stored
+    as JSON along with an expiry time, and the least recently used entries
+    are evicted once the cache grows past max_bytes. Counts hits and misses
+    so each run can report how much network time the cache saved.
+
+    Parameters 
+    -----–-----------
+    path: str
+        Where to keep the SQLite database (i.e. "data/cache/statsapi_cache.sqlite")
+
+    max_bytes: int
+        The most response data to keep before evicting old entries.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connection_pid = None
+        self.total_bytes = 0
+
+    def connect(self):
+        # Connections can't be shared with forked worker processes, so 
+        # each process opens its own the first time it uses the cache.
+        if self.connection is None or self.connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                       key TEXT PRIMARY KEY, value TEXT, size INTEGER, 
+                                       expires_at REAL, last_used REAL)""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.connection.commit()
+            self.connection_pid = os.getpid()
+            self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self.connection
+
+    def get(self, key):
+        """
+        Returns a tuple (found, value). found is False if the key isn't
+        cached or its entry has expired.
+        """
+        with self.lock:
+            connection = self.connect()
+            now = time.time()
+            entry = connection.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if entry is None or (entry[1] is not None and entry[1] < now):
+                self.misses += 1
+                return False, None
+            connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self.hits += 1
+            return True, json.loads(entry[0])
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            connection = self.connect()
+            serialized = json.dumps(value)
+            old_size = connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", 
+                               (key, serialized, len(serialized), expires_at, time.time()))
+            self.total_bytes += len(serialized) - (old_size[0] if old_size else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            connection.commit()
+
+    def evict(self):
+        # Drop expired entries first, then the least recently used ones
+        # until the cache is back under 90% of its size limit.
+        connection = self.connect()
+        connection.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        self.total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = self.max_bytes * 0.9
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if self.total_bytes <= target:
+                break
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= size
+
+    def summary(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return "Cache hits: {}, misses: {} ({:.1%} hit rate)".format(self.hits, self.misses, hit_rate)
+
+response_cache = ResponseCache(CACHE_PATH, CACHE_MAX_BYTES)
+
+def cache_expiry(ttl_class):
+    """
+    Returns the timestamp at which a response in the given endpoint 
+    class should expire, or None if it never does.
+
+    Parameters 
+    -----–-----------
+    ttl_class: str
+        One of the keys of CACHE_TTLS (i.e. 'daily')
+    """
+    ttl = CACHE_TTLS[ttl_class]
+    if ttl is None:
+        return None
+    if ttl == "end_of_day":
+        tomorrow = datetime.date.today() + datetime.timedelta(days = 1)
+        return time.mktime(tomorrow.timetuple())
+    return time.time() + ttl
+
+def cached_call(ttl_class, func, *args, **kwargs):
+    """
+    Same as call_statsapi, but checks the response cache first and 
+    stores new responses in it. 
+
+    Parameters 
+    -----–-----------
+    ttl_class: str or function
+        The endpoint class that decides how long the response stays 
+        cached (see CACHE_TTLS). Can also be a function that takes the 
+        response and returns the class, for responses like boxscores 
+        that only stop changing once the game is over.
+
+    func: function
+        The statsapi function to call (i.e. statsapi.get)
+
+    *args, **kwargs:
+        Passed through to func.
+    """
+    # Replays skip the cache, so they exercise the same code as a run
+    # against the API
+    if not USE_CACHE or fixtures.MODE == 'replay':
+        return call_statsapi(func, *args, **kwargs)
+
+    key = request_key(func, args, kwargs)
+    found, value = response_cache.get(key)
+    instrumentation.record_cache('statsapi', endpoint_name(func, args), found)
+    if found:
+        # Cached responses are recorded too, so the fixture set has 
+        # every response the run needed
+        if fixtures.MODE == 'record':
+            fixtures.record(key, value)
+        return value
+
+    value = call_statsapi(func, *args, **kwargs)
+    if callable(ttl_class):
+        ttl_class = ttl_class(value)
+    response_cache.set(key, value, cache_expiry(ttl_class))
+    return value
+
+def game_ttl_class(game):
+    """
+    Boxscores stop changing once a game is final, so they can be 
+    cached forever. Anything else is treated as live.
+    """
+    try:
+        final = game['gameData']['status']['abstractGameState'] == 'Final'
+    except KeyError:
+        final = False
+    return 'immutable' if final else 'live'
 
 ################################################## UTILITY/GETTER FUNCTIONS #######################################################
 
+def parse_stat(value):
+    """
+    Converts a stat from the API to a float. The API sends rate stats 
+    as strings, with placeholders like "-.--" or ".---" when the rate
+    is undefined; those (and missing stats) become 0.0.
+
+    Parameters 
+    -----–-----------
+    value: str, int, float or None
+        The stat's value as returned by the API (i.e. ".247")
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def stats_to_columns(stats, stat_names, suffix=""):
+    """
+    Picks out the stats named in stat_names from an API stat dictionary,
+    in that order, and returns them as floats in an OrderedDict keyed by
+    column name. Stats missing from the dictionary are filled with 0.0,
+    so the columns are always the same no matter what the API returns.
+
+    Parameters 
+    -----–-----------
+    stats: dict
+        A 'stat' dictionary from the API (i.e. from a split in a person's stats)
+
+    stat_names: list of str
+        The stats to keep (i.e. PAST_N_HITTING_STATS)
+
+    suffix: str
+        Appended to each column name (i.e. "_p7G")
+    """
+    return OrderedDict((stat_name + suffix, parse_stat(stats.get(stat_name))) for stat_name in stat_names)
+
+def normalize_name(name):
+    """
+    Normalizes a player's name for lookups, so the same player matches 
+    no matter how their name was written: accents and punctuation are
+    dropped, case is ignored, and names in Last, First format are
+    flipped (i.e. "Acuña Jr., Ronald" -> "ronald acuna jr").
+
+    Parameters 
+    -----–-----------
+    name: str
+        The name of a player in any format.
+    """
+    if "," in name:
+        last, first = name.split(",", 1)
+        name = first + " " + last
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    name = "".join(c for c in name.lower() if c.isalnum() or c.isspace() or c == "-")
+    return " ".join(name.split())
+
+class PlayerIndex:
+    """
+    In-memory index of every MLB player in a season, built from a single
+    `sports_players` request. Players are keyed by ID, with a second
+    dictionary from normalized name (see normalize_name) to IDs, so 
+    resolving a name is a dictionary lookup rather than a fuzzy search
+    through statsapi.lookup_player. Each entry keeps the player's name,
+    position, handedness and team:
+
+        {'id': 457763, 'fullName': 'Buster Posey', 'position': 'C', 
+         'batSide': 'R', 'pitchHand': 'R', 'teamId': 137}
+    """
+
+    def __init__(self, people):
+        self.by_id = {}
+        self.by_name = {}
+        for person in people:
+            self.by_id[person['id']] = {'id': person['id'], 
+                                        'fullName': person.get('fullName', ""),
+                                        'position': person.get('primaryPosition', {}).get('abbreviation'),
+                                        'batSide': person.get('batSide', {}).get('code'),
+                                        'pitchHand': person.get('pitchHand', {}).get('code'),
+                                        'teamId': person.get('currentTeam', {}).get('id')}
+            self.by_name.setdefault(normalize_name(person.get('fullName', "")), []).append(person['id'])
+
+    def get(self, player_id):
+        """
+        Returns a player's entry, or None if they aren't in the index.
+        """
+        return self.by_id.get(player_id)
+
+    def lookup(self, player_name):
+        """
+        Returns the entries of every player whose normalized name matches
+        player_name (more than one for players who share a name), or an 
+        empty list.
+        """
+        return [self.by_id[player_id] for player_id in self.by_name.get(normalize_name(player_name), [])]
+
+player_indexes = {}
+player_indexes_lock = threading.Lock()
+
+@instrumentation.traced('feature')
+def get_player_index(season=None):
+    """
+    Returns the PlayerIndex for a season, building it the first time it's
+    needed. The request behind it is cached for the rest of the day, so
+    the index is only downloaded once a day.
+
+    Parameters 
+    -----–-----------
+    season: int
+        The season to index (i.e. 2019). Defaults to the current year.
+    """
+    import statsapi
+    season = season or datetime.date.today().year
+    with player_indexes_lock:
+        if season not in player_indexes:
+            r = cached_call('daily', statsapi.get, 'sports_players', {'sportId': 1, 'season': season})
+            player_indexes[season] = PlayerIndex(r.get('people', []))
+        return player_indexes[season]
+
+@instrumentation.traced('feature')
+def get_team_roster(team_id, gameday=None):
+    """
+    Returns a team's active roster as a list of dictionaries like
+    {'id': 457763, 'name': 'Buster Posey', 'position': 'C', 'status': 'A'}, straight
+    from the `team_roster` endpoint, so players don't have to be looked 
+    up by name.
+
+    Parameters 
+    -----–-----------
+    team_id: int
+        The team ID number (i.e. 137 for S.F. Giants)
+
+    gameday: str
+        The day to get the roster for, in MM/DD/YYYY format. Defaults to
+        today's roster.
+    """
+    import statsapi
+    params = {'teamId': team_id}
+    if gameday is not None:
+        params['date'] = gameday
+    r = cached_call('daily', statsapi.get, 'team_roster', params)
+    return [{'id': player['person']['id'], 'name': player['person']['fullName'],
+             'position': player.get('position', {}).get('abbreviation'),
+             'status': player.get('status', {}).get('code')}
+            for player in r.get('roster', [])]
+
+@instrumentation.traced('feature')
+def select_candidates(team_id, lineup=None, gameday=None):
+    """
+    Picks the players on a team worth building rows for, before any of
+    their stats are fetched. Returns a list of players in the format of
+    get_team_roster().
+
+    If the team's starting lineup has been posted, only the starters are
+    kept, and no roster request is made. Otherwise the whole active 
+    roster is kept apart from pitchers and anyone whose status isn't
+    active (i.e. injured players). Pitchers never get rows either way.
+
+    Parameters 
+    -----–-----------
+    team_id: int
+        The team ID number (i.e. 137 for S.F. Giants)
+
+    lineup: list of dict
+        The team's starting lineup from get_lineups(), or None.
+
+    gameday: str
+        The day of the game, in MM/DD/YYYY format.
+    """
+    if lineup:
+        players = [{'id': player['id'], 'name': player['fullName'], 
+                    'position': player.get('primaryPosition', {}).get('abbreviation'), 'status': 'A'}
+                   for player in lineup]
+    else:
+        players = [player for player in get_team_roster(team_id, gameday) if player['status'] in [None, 'A']]
+    return [player for player in players if player['position'] != "P"]
+
 def get_player_list(team_id):
     """
     A function that gets a list of every player (including pitchers) a given team.
@@ -29,27 +543,25 @@ def get_player_list(team_id):
     team_id: int
         The team ID number (i.e. 137 for S.F. Giants)
     """
-    player_names = []
-    roster = statsapi.roster(team_id)
-    roster_list = roster.split("\n")[:-1]
-    for player in roster_list:
-        player_names.append(" ".join(player.split()[2:]))
-    return player_names
+    return [player['name'] for player in get_team_roster(team_id)]
 
-def get_player_id_from_name(player_name):
+def get_player_id_from_name(player_name, season=None):
     """
     A function that gets the player ID for a name entered in any 
-    format (Last, First; First Last; Last, etc.).
+    format (Last, First; First Last, with or without accents), from the
+    season's PlayerIndex. Returns False if no player has that name. If
+    more than one does, the first one in the index is returned.
     
     Parameters 
     -----–-----------
     player_name: str
         The name of a player as a string (i.e. "Buster Posey")
+
+    season: int
+        The season to look the player up in. Defaults to the current year.
     """
-    try:
-        return statsapi.lookup_player(player_name)[0]['id']
-    except IndexError:
-        return False
+    players = get_player_index(season).lookup(player_name)
+    return players[0]['id'] if players else False
 
 def check_pos_player(player_name):
     """
@@ -61,12 +573,74 @@ def check_pos_player(player_name):
     player_name: str
         The name of a player as a string (i.e. "Buster Posey")
     """
-    try:
-        return statsapi.lookup_player(player_name)[0]['primaryPosition']['abbreviation'] != "P"
-    except IndexError:
-        return False
+    players = get_player_index().lookup(player_name)
+    return bool(players) and players[0]['position'] != "P"
 
-def get_current_season_stats(player_name):
+@instrumentation.traced('feature')
+def fetch_player_profiles(player_ids, opponent_id, season, requests=None):
+    """
+    Fetches everything the feature functions below need to know about a
+    group of batters facing the same pitcher, using three batched `people`
+    requests instead of separate requests for every player and stat type.
+    Returns a dictionary mapping each player ID to a profile like:
+
+        {'id': 457763, 'fullName': 'Buster Posey', 'currentTeam': {...},
+         'primaryPosition': {...}, 'batSide': {...},
+         'stats': {'season': {...}, 'vsPlayer': {...},
+                   'lastXGames_7': {...}, 'lastXGames_15': {...}}}
+
+    Stat types the API has nothing for (i.e. no at bats against the
+    pitcher) are left out of the profile's 'stats' dictionary.
+
+    Parameters
+    -----–-----------
+    player_ids: list of int
+        The 6-digit IDs of the batters, usually one team's roster.
+
+    opponent_id: int
+        The 6-digit ID of the pitcher the batters are facing, used for
+        head-to-head stats.
+
+    season: int
+        The season to get season and head-to-head stats for (i.e. 2019)
+
+    requests: list of str
+        Which of the three requests to make ('season', 'lastXGames_7' and
+        'lastXGames_15'). Defaults to all of them. The 'season' request 
+        alone is enough for head-to-head stats and handedness.
+    """
+    import statsapi
+    player_ids = [player_id for player_id in player_ids if player_id]
+    if not player_ids:
+        return {}
+
+    # Without a probable pitcher there's no head-to-head split to ask for
+    season_stats = "type=[season,vsPlayer],opposingPlayerId={}".format(opponent_id) if opponent_id else "type=[season]"
+    hydrates = {
+        'season': 'currentTeam,stats(group=[hitting],{},season={},sportId=1)'.format(season_stats, season),
+        'lastXGames_7': 'stats(group=[hitting],type=[lastXGames],limit=7)',
+        'lastXGames_15': 'stats(group=[hitting],type=[lastXGames],limit=15)',
+    }
+
+    profiles = {}
+    for request, hydrate in hydrates.items():
+        if requests is not None and request not in requests:
+            continue
+        params = {'personIds': ",".join(str(player_id) for player_id in player_ids), 'hydrate': hydrate}
+        r = cached_call('daily', statsapi.get, 'people', params)
+        for person in r.get('people', []):
+            profile = profiles.setdefault(person['id'], dict(person, stats={}))
+            for stat_group in person.get('stats', []):
+                if not stat_group.get('splits'):
+                    continue
+                stat_type = stat_group['type']['displayName']
+                if stat_type == 'lastXGames':
+                    stat_type = request
+                profile['stats'][stat_type] = stat_group['splits'][0]['stat']
+    return profiles
+
+@instrumentation.traced('feature')
+def get_current_season_stats(player_name, profile=None):
     """
     One of the main data retrieval functions. Returns a dictionary 
     mapping the names of different statistics to the values of those
@@ -77,35 +651,22 @@ def get_current_season_stats(player_name):
     -----–-----------
     player_name: str
         The name of a player as a string (i.e. "Buster Posey")
+
+    profile: dict
+        The player's profile from fetch_player_profiles(). If passed,
+        stats are read from it instead of being requested.
     """
 
-    if not check_pos_player(player_name):
+    if profile is None:
+        player_id = get_player_id_from_name(player_name)
+        profile = fetch_player_profiles([player_id], None, datetime.date.today().year).get(player_id)
+
+    if profile is None or profile['primaryPosition']['abbreviation'] == "P":
         raise ValueError("Player name entered is not a position player")
-        
-    player_id = get_player_id_from_name(player_name)
-    stats_dict = OrderedDict({"Name": player_name, "ID": player_id, 
-                  "Team": statsapi.lookup_player(player_id)[0]['currentTeam']['id']})
-    
-    # Look up the player's current season hitting stats
-    get_player_stats = statsapi.player_stats(player_id, 'hitting') 
-    
-    # Get the stats for the most recent season
-    curr_season_stats = get_player_stats.split("Season Hitting")[-1]
-    
-    #Break up the stats into a list
-    stats_list = curr_season_stats.split("\n")[1:-2]
-    for stat in stats_list:
-        stat_name = re.search("[A-Za-z]+", stat).group()
-        
-        # Temporary fix for a bug that appeared 8/20/2019.
-        if stat_name == 'flyOuts':
-            continue
-            
-        stat_val = re.search("[^:A-Za-z]+", stat).group()
-        try:
-            stats_dict[stat_name] = float(stat_val)
-        except ValueError:
-            stats_dict[stat_name] = 0.0
+
+    stats_dict = OrderedDict({"Name": player_name, "ID": profile['id'], 
+                  "Team": profile['currentTeam']['id']})
+    stats_dict.update(stats_to_columns(profile['stats'].get('season', {}), SEASON_HITTING_STATS))
     return stats_dict
 
 
@@ -115,7 +676,8 @@ def get_current_season_stats(player_name):
 # over the past x days and how to get head-to-head batting stats. The post is linked
 # here: https://www.reddit.com/r/mlbdata/comments/cewwfo/getting_headtohead_batting_stats_and_last_x_games/?
 
-def get_h2h_vs_pitcher(batter_id, opponent_id):
+@instrumentation.traced('feature')
+def get_h2h_vs_pitcher(batter_id, opponent_id, profile=None, season=None):
     """
     Returns a dictionary containing a limited amount of head-to-head batting 
     statistics between the hitter (batter_id) and pitcher (opponent_id) 
@@ -130,35 +692,35 @@ def get_h2h_vs_pitcher(batter_id, opponent_id):
     opponent_id: int
         The 6-digit ID of a pitcher, which can be fetched using 
         get_player_id_from_name('Pitcher Name').
+
+    profile: dict
+        The batter's profile from fetch_player_profiles(), fetched 
+        against the same pitcher. If passed, no request is made.
+
+    season: int
+        The season to get head-to-head stats for. Defaults to the 
+        current year.
     """
-    
-    hydrate = 'stats(group=[hitting],type=[vsPlayer],opposingPlayerId={},season=2019,sportId=1)'.format(opponent_id)
-    params = {'personId': batter_id, 'hydrate':hydrate, 'sportId':1}
-    r = statsapi.get('person',params)
+    import statsapi
     
     # Look up batting stats versus pitcher, if atBats_h2h == 0 return 
     # a dictionary of empty stats.
     try: 
-        batting_stats = r['people'][0]['stats'][1]['splits'][0]['stat']
-    except KeyError:
-        return OrderedDict({'atBats_h2h': 0.0, 'avg_h2h': 0.0, 'hits_h2h': 0.0, 
-                            'obp_h2h': 0.0, 'ops_h2h': 0.0, 'slg_h2h': 0.0})
-    
-    # Only get rate stats vs pitcher
-    filtered = {(k + "_h2h"):(float(v) if v != "-.--" and v != ".---" and v != "*.**" else 0.0)
-                for k, v in batting_stats.items() 
-                if type(v) == str 
-                and k != 'stolenBasePercentage'
-                and k != 'atBatsPerHomeRun'
-                or k == 'hits'
-                or k == 'atBats'} 
-    
-    # Making sure the keys are in the same order regardless of players entered
-    filtered = OrderedDict(sorted(filtered.items()))
+        if profile is not None:
+            batting_stats = profile['stats']['vsPlayer']
+        else:
+            season = season or datetime.date.today().year
+            hydrate = 'stats(group=[hitting],type=[vsPlayer],opposingPlayerId={},season={},sportId=1)'.format(opponent_id, season)
+            params = {'personId': batter_id, 'hydrate':hydrate, 'sportId':1}
+            r = cached_call('daily', statsapi.get, 'person', params)
+            batting_stats = r['people'][0]['stats'][1]['splits'][0]['stat']
+    except (KeyError, IndexError):
+        batting_stats = {}
     
-    return filtered
+    return stats_to_columns(batting_stats, H2H_HITTING_STATS, "_h2h")
 
-def batting_past_N_games(N, player_id):  
+@instrumentation.traced('feature')
+def batting_past_N_games(N, player_id, profile=None):  
     """
     Returns a dictionary containing a limited amount of batting statistics 
     over the past N games for a specified player. One of the main data retrieval 
@@ -172,31 +734,30 @@ def batting_past_N_games(N, player_id):
     player_id: int
         The 6-digit ID of a hitter, which can be fetched using 
         get_player_id_from_name('Hitter Name').
+
+    profile: dict
+        The player's profile from fetch_player_profiles(). If passed,
+        stats are read from it instead of being requested. Profiles
+        only include the past 7 and 15 games.
     """
-    
-    hydrate = 'stats(group=[hitting],type=[lastXGames],limit={}),currentTeam'.format(N)
-    params = {'personId': player_id, 'hydrate':hydrate}
+    import statsapi
     
     # Attempt to look up stats over the past N games, and if nothing comes
     # up, return a list of stats containing only 0.0. 
     try:
-        r = statsapi.get('person',params)
-        batting_stats = r['people'][0]['stats'][0]['splits'][0]['stat']
-    except (ValueError, KeyError):
-        return {k:v for k, v in (zip(np.arange(5), [0.0]*5))}
+        if profile is not None:
+            batting_stats = profile['stats']['lastXGames_{}'.format(N)]
+        else:
+            hydrate = 'stats(group=[hitting],type=[lastXGames],limit={}),currentTeam'.format(N)
+            params = {'personId': player_id, 'hydrate':hydrate}
+            r = cached_call('daily', statsapi.get, 'person', params)
+            batting_stats = r['people'][0]['stats'][0]['splits'][0]['stat']
+    except (ValueError, KeyError, IndexError):
+        batting_stats = {}
     
-    # Only get rate stats for past N games
-    filtered = {k + "_p{}G".format(N):(float(v) if v != "-.--" and v != ".---" and v != "*.**" else 0.0)
-                for k, v in batting_stats.items() 
-                if type(v) == str 
-                and k != 'stolenBasePercentage'
-                or k == 'hits'} 
-    
-    # Preserving order across players
-    filtered = OrderedDict(sorted(filtered.items()))
-    
-    return filtered
+    return stats_to_columns(batting_stats, PAST_N_HITTING_STATS, "_p{}G".format(N))
 
+@instrumentation.traced('feature')
 def pitching_past_N_games(N, player_id):
     """
     Returns a dictionary containing a limited amount of pitching statistics 
@@ -212,33 +773,21 @@ def pitching_past_N_games(N, player_id):
         The 6-digit ID of a pitcher, which can be fetched using 
         get_player_id_from_name('Pitcher Name').
     """
-    
-    # Jose Abreu's (1B) name gets looked up if you pass in 
-    # an empty string to statsapi.lookup_player().
-    if player_id == 547989:
-        return {k:v for k, v in (zip(np.arange(15), [0.0]*15))}
+    import statsapi
     
     hydrate = 'stats(group=[pitching],type=[lastXGames],limit={}),currentTeam'.format(N)
     params = {'personId': player_id, 'hydrate':hydrate}
     
     try:
-        r = statsapi.get('person',params)
-    except ValueError:  # The request fails if a pitcher is making their debut
-        return {k:v for k, v in (zip(np.arange(15), [0.0]*15))}
-    
-    pitching_stats = r['people'][0]['stats'][0]['splits'][0]['stat']
+        r = cached_call('daily', statsapi.get, 'person', params)
+        pitching_stats = r['people'][0]['stats'][0]['splits'][0]['stat']
+    except (ValueError, KeyError, IndexError):  # The request fails if a pitcher is making their debut
+        pitching_stats = {}
     
-    # Only get rate stats for past N days
-    filtered = {(k + "_p{}G".format(N)):(float(v) if v != "-.--" and v != ".---" and v != "*.**" else 0.0)
-                for k, v in pitching_stats.items() 
-                if type(v) == str} 
-    
-    # Preserving order across players
-    filtered = OrderedDict(sorted(filtered.items()))
-    
-    return filtered
+    return stats_to_columns(pitching_stats, PAST_N_PITCHING_STATS, "_p{}G".format(N))
 
-def check_pitcher_right_handed(pitcher_id):
+@instrumentation.traced('feature')
+def check_pitcher_right_handed(pitcher_id, season=None):
     """
     Returns a bool indicating whether a pitcher is right handed.
 
@@ -247,15 +796,25 @@ def check_pitcher_right_handed(pitcher_id):
     pitcher_id: int
         The 6-digit ID of a pitcher, which can be fetched using 
         get_player_id_from_name('Pitcher Name').        
+
+    season: int
+        The season whose player index to look in (i.e. 2019), so pitchers
+        from a past season don't each need a request. Defaults to the
+        current year.
     """
+    import statsapi
+    player = get_player_index(season).get(pitcher_id)
+    if player is not None and player['pitchHand']:
+        return player['pitchHand'] == 'R'
     try:
         params = {'personId': pitcher_id}
-        r = statsapi.get('person',params)
+        r = cached_call('immutable', statsapi.get, 'person', params)
         return r['people'][0]['pitchHand']['code'] == 'R'
     except IndexError:
         return True # Most pitchers are righties
 
-def check_batter_right_handed(batter_id):
+@instrumentation.traced('feature')
+def check_batter_right_handed(batter_id, profile=None, season=None):
     """
     Returns a bool indicating whether a hitter is right handed.
 
@@ -264,15 +823,30 @@ def check_batter_right_handed(batter_id):
     batter_id: int
         The 6-digit ID of a batter, which can be fetched using 
         get_player_id_from_name('Hitter Name').        
+
+    profile: dict
+        The batter's profile from fetch_player_profiles(). If passed, 
+        no request is made.
+
+    season: int
+        The season whose player index to look in (i.e. 2019). Defaults 
+        to the current year.
     """
+    import statsapi
+    if profile is not None:
+        return profile.get('batSide', {}).get('code', 'R') == 'R'
+    player = get_player_index(season).get(batter_id)
+    if player is not None and player['batSide']:
+        return player['batSide'] == 'R'
     try:
         params = {'personId': batter_id}
-        r = statsapi.get('person',params)
+        r = cached_call('immutable', statsapi.get, 'person', params)
         return r['people'][0]['batSide']['code'] == 'R'
     except IndexError:
         return True # Most batters are righties
 
-def check_pitcher_batter_opposite_hand(batter_id, pitcher_id):
+def check_pitcher_batter_opposite_hand(batter_id, pitcher_id, batter_profile=None, pitcher_right_handed=None,
+                                       season=None):
     """
     Returns a bool indicating whether a batter and pitcher 
     have opposite handedness.
@@ -286,10 +860,217 @@ def check_pitcher_batter_opposite_hand(batter_id, pitcher_id):
     pitcher_id: int
         The 6-digit ID of a pitcher, which can be fetched using 
         get_player_id_from_name('Pitcher Name'). 
+
+    batter_profile: dict
+        The batter's profile from fetch_player_profiles(), if available.
+
+    pitcher_right_handed: bool
+        The pitcher's handedness from the day's pitcher table (see 
+        get_pitcher_table), if available.
+
+    season: int
+        The season whose player index to look in (i.e. 2019). Defaults 
+        to the current year.
+    """
+    if pitcher_right_handed is None:
+        pitcher_right_handed = check_pitcher_right_handed(pitcher_id, season)
+    return pitcher_right_handed != check_batter_right_handed(batter_id, profile=batter_profile, season=season)
+
+hydrated_schedules = {}
+hydrated_schedules_lock = threading.Lock()
+
+@instrumentation.traced('feature')
+def get_hydrated_schedule(gameday, refresh=False):
+    """
+    Returns a dictionary mapping each game ID on a day to the game from
+    a single schedule request hydrated with probable pitchers and 
+    starting lineups. The request is made once per day per process.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to look up, in MM/DD/YYYY format.
+
+    refresh: bool
+        Request the schedule again, skipping the response cache, and
+        replace this process's copy.
+    """
+    import statsapi
+    with hydrated_schedules_lock:
+        if gameday not in hydrated_schedules or refresh:
+            params = {'sportId': 1, 'date': gameday, 'hydrate': 'probablePitcher,lineups'}
+            if refresh:
+                r = call_statsapi(statsapi.get, 'schedule', params)
+            else:
+                r = cached_call('live', statsapi.get, 'schedule', params)
+            hydrated_schedules[gameday] = {game['gamePk']: game for date in r.get('dates', []) 
+                                           for game in date.get('games', [])}
+        return hydrated_schedules[gameday]
+
+def get_probable_pitcher_ids(gameday):
+    """
+    Returns a dictionary mapping each game ID on a day to the IDs of its
+    probable pitchers, i.e. {565905: {'home': 605483, 'away': 592789}},
+    from the hydrated schedule, so pitchers don't have to be looked up 
+    by name. A pitcher's ID is None if they haven't been announced.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to look up, in MM/DD/YYYY format.
+    """
+    return {game_id: {side: game['teams'][side].get('probablePitcher', {}).get('id') for side in ['home', 'away']}
+            for game_id, game in get_hydrated_schedule(gameday).items()}
+
+def get_lineups(gameday):
+    """
+    Returns a dictionary mapping each game ID on a day to its confirmed
+    starting lineups, from the hydrated schedule, i.e. 
+    {565905: {'home': [{'id': 457763, 'fullName': 'Buster Posey', ...}, ...], 'away': None}}.
+    A lineup is None until the team posts it, usually a few hours 
+    before the game.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to look up, in MM/DD/YYYY format.
+    """
+    return {game_id: {side: game.get('lineups', {}).get(side + 'Players') or None for side in ['home', 'away']}
+            for game_id, game in get_hydrated_schedule(gameday).items()}
+
+@instrumentation.traced('feature')
+def fetch_pitcher_table(pitcher_ids, pitching_tables=None, season=None):
+    """
+    Fetches the features of a group of pitchers with one batched `people`
+    request. Returns a dictionary mapping each pitcher ID to a row like:
+
+        {'id': 605483, 'right_handed': True, 'p5G': {'avg_p5G': 0.219, ...}}
+
+    where 'p5G' has the same columns as pitching_past_N_games(5, pitcher_id).
+
+    Parameters 
+    -----–-----------
+    pitcher_ids: list of int
+        The 6-digit IDs of the pitchers.
+
+    pitching_tables: dict
+        The 'pitching' tables from get_past_n_tables(). If passed, past 5 
+        game stats come from them and handedness from the player index,
+        so no `people` request is made.
+
+    season: int
+        The season the pitchers are pitching in (i.e. 2019), whose player
+        index has their handedness. Defaults to the current year.
+    """
+    import statsapi
+    pitcher_ids = sorted(set(pitcher_id for pitcher_id in pitcher_ids if pitcher_id))
+    pitcher_table = {}
+    if not pitcher_ids:
+        return pitcher_table
+
+    if pitching_tables is not None:
+        for pitcher_id in pitcher_ids:
+            pitching_stats = {}
+            if pitcher_id in pitching_tables[5].index:  # Pitchers making their debut have no games stored
+                pitching_stats = pitching_tables[5].loc[pitcher_id].to_dict()
+            pitcher_table[pitcher_id] = {'id': pitcher_id, 
+                                         'right_handed': check_pitcher_right_handed(pitcher_id, season),
+                                         'p5G': stats_to_columns(pitching_stats, PAST_N_PITCHING_STATS, "_p5G")}
+        return pitcher_table
+
+    params = {'personIds': ",".join(str(pitcher_id) for pitcher_id in pitcher_ids), 
+              'hydrate': 'stats(group=[pitching],type=[lastXGames],limit=5)'}
+    r = cached_call('daily', statsapi.get, 'people', params)
+    for person in r.get('people', []):
+        try:
+            pitching_stats = person['stats'][0]['splits'][0]['stat']
+        except (KeyError, IndexError):  # Nothing comes back for a pitcher making their debut
+            pitching_stats = {}
+        pitcher_table[person['id']] = {'id': person['id'],
+                                       'right_handed': person.get('pitchHand', {}).get('code', 'R') == 'R',
+                                       'p5G': stats_to_columns(pitching_stats, PAST_N_PITCHING_STATS, "_p5G")}
+    return pitcher_table
+
+def pitcher_features(pitcher_table, pitcher_id):
+    """
+    Returns a pitcher's row from a pitcher table, or a row of empty
+    stats if the pitcher isn't in it (i.e. no probable pitcher has been 
+    announced).
+    """
+    if pitcher_id in pitcher_table:
+        return pitcher_table[pitcher_id]
+    return {'id': pitcher_id, 'right_handed': True,  # Most pitchers are righties
+            'p5G': stats_to_columns({}, PAST_N_PITCHING_STATS, "_p5G")}
+
+pitcher_tables = {}
+pitcher_tables_lock = threading.Lock()
+
+@instrumentation.traced('feature')
+def get_pitcher_table(gameday):
+    """
+    Returns the probable pitcher IDs (see get_probable_pitcher_ids) and the
+    pitcher table (see fetch_pitcher_table) for every probable pitcher on
+    a day. Both are built once per day per process, and every batter's 
+    row joins against them. The requests behind them are also kept in the
+    response cache, so train and test runs on the same day share them.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to look up, in MM/DD/YYYY format.
+    """
+    with pitcher_tables_lock:
+        if gameday not in pitcher_tables:
+            probable_pitcher_ids = get_probable_pitcher_ids(gameday)
+            pitcher_ids = [pitcher_id for game in probable_pitcher_ids.values() for pitcher_id in game.values()]
+            tables = get_past_n_tables(gameday)
+            pitcher_tables[gameday] = (probable_pitcher_ids, 
+                                       fetch_pitcher_table(pitcher_ids, tables['pitching'] if tables else None,
+                                                           feature_store.to_date(gameday).year))
+        return pitcher_tables[gameday]
+
+@instrumentation.traced('feature')
+def get_boxscore(game_id):
+    """
+    Returns a game's boxscore, with every player's batting and pitching
+    line. Labels (see get_game_hits_index) and game logs (see 
+    update_game_logs) both come from this one request per game.
+
+    Parameters 
+    -----–-----------
+    game_id: int
+        The 6-digit ID for a game, can be fetched from statsapi.schedule().
+    """
+    import statsapi
+    stat_fields = sorted(set(game_logs.HITTING_COUNTS + game_logs.PITCHING_COUNTS) - {'outs'})
+    params = {'gamePk':game_id,
+      'fields': 'gameData,status,abstractGameState,teams,teamName,shortName,teamStats,batting,atBats,runs,hits,rbi,strikeOuts,baseOnBalls,leftOnBase,players,boxscoreName,liveData,boxscore,teams,players,id,fullName,batting,avg,ops,era,battingOrder,info,title,fieldList,note,label,value,'
+                + 'stats,pitching,inningsPitched,' + ",".join(stat_fields)}
+    r = cached_call(game_ttl_class, statsapi.get, 'game', params)
+    return r['liveData']['boxscore']
+
+@instrumentation.traced('feature')
+def get_game_hits_index(game_id):
     """
-    return check_pitcher_right_handed(pitcher_id) != check_batter_right_handed(batter_id)
+    Returns a dictionary mapping the ID of every player who appeared in 
+    a game (on either team) to their number of hits in that game. Only 
+    makes one request per game, so every row for the game can be labeled
+    from the same boxscore.
 
-def player_got_hit_in_game(player_id, game_id, home_or_away):
+    Parameters 
+    -----–-----------
+    game_id: int
+        The 6-digit ID for a game, can be fetched from statsapi.schedule().
+    """
+    boxscore = get_boxscore(game_id)
+
+    hits_index = {}
+    for home_or_away in ['home', 'away']:
+        for player_key, player_stats in boxscore['teams'][home_or_away]['players'].items():
+            hits_index[int(player_key.replace('ID', ''))] = player_stats['stats']['batting'].get('hits', 0)
+    return hits_index
+
+def player_got_hit_in_game(player_id, game_id, hits_index=None):
     """
     This function generates labels for training data. Checks if a 
     player got a hit in a specified game. 
@@ -303,56 +1084,304 @@ def player_got_hit_in_game(player_id, game_id, home_or_away):
     game_id: int
         The 6-digit ID for a game, can be fetched from statsapi.schedule().
     
-    home_or_away: bool
-        Indicates whether the player was on the home team or the 
-        away team for the specified game.
+    hits_index: dict
+        The game's hits index from get_game_hits_index(game_id). Pass it
+        in when labeling many players from the same game so the boxscore
+        is only fetched once.
     """
-    
-    params = {'gamePk':game_id,
-      'fields': 'gameData,teams,teamName,shortName,teamStats,batting,atBats,runs,hits,rbi,strikeOuts,baseOnBalls,leftOnBase,players,boxscoreName,liveData,boxscore,teams,players,id,fullName,batting,avg,ops,era,battingOrder,info,title,fieldList,note,label,value'}
-    r = statsapi.get('game', params)
-    player_stats = r['liveData']['boxscore']['teams'][home_or_away]['players'].get('ID' + str(player_id), False)
-    if not player_stats: 
-        return False 
-    else:
-        return player_stats['stats']['batting'].get('hits', 0) > 0
+    if hits_index is None:
+        hits_index = get_game_hits_index(game_id)
+    return hits_index.get(player_id, 0) > 0
+
 
-def convert_to_FL_format(name):
+################################################## GAME LOGS ######################################################################
+
+def update_game_logs(start_date, end_date):
     """
-    Takes the name of a player in Last, First format and converts
-    it to First Last format. 
+    Adds every finished game between start_date and end_date to the game
+    log store (see game_logs.py), one partition per day for hitting and 
+    for pitching. Days that are already stored are skipped, and so is 
+    today, since its games aren't over. Boxscores are fetched through a 
+    pool of MAX_WORKERS threads.
 
     Parameters 
     -----–-----------
-    name: str
-        The name of a player in Last, First format.  
+    start_date, end_date: str
+        The first and last days to add, in MM/DD/YYYY format.
     """
-    last_first = name.split(",")
-    last_first.reverse()
-    last_first[0] = last_first[0].strip()
-    return " ".join(last_first)
+    import statsapi
+    stored_dates = set(game_logs.list_dates())
+    for gameday in date_range(start_date, end_date):
+        if feature_store.to_date(gameday) in stored_dates or feature_store.to_date(gameday) >= datetime.date.today():
+            continue
+        games = cached_call('live', statsapi.schedule, gameday)
+        game_ids = list(OrderedDict.fromkeys(game['game_id'] for game in games if game['status'] in FINAL_GAME_STATUSES))
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            boxscores = list(executor.map(get_boxscore, game_ids))
+
+        lines = [game_logs.boxscore_lines(boxscore, game_id) for boxscore, game_id in zip(boxscores, game_ids)]
+        for i, group in enumerate(['hitting', 'pitching']):
+            group_lines = [game_lines[i] for game_lines in lines]
+            day_lines = pd.concat(group_lines, ignore_index=True) if group_lines \
+                        else pd.DataFrame(columns=game_logs.log_schema(group).names)
+            game_logs.write_day(group, gameday, day_lines)
+        print("Added game logs for {}: {} games".format(gameday, len(game_ids)))
+
+past_n_tables = {}
+past_n_tables_lock = threading.Lock()
+
+def get_past_n_tables(gameday):
+    """
+    Returns every player's past N game stats as of the start of a day, 
+    for BATTING_WINDOWS and PITCHING_WINDOWS, computed from the game log
+    store (see game_logs.past_n_games):
+
+        {'hitting': {7: <dataframe indexed by ID>, 15: ...}, 'pitching': {5: ...}}
+
+    Any days missing from the store since the last one stored are added
+    first. Returns None if the store hasn't been started or USE_GAME_LOGS
+    is off, in which case the stats are requested from the API instead.
+    The tables are built once per day per process.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to look up, in MM/DD/YYYY format.
+    """
+    if not USE_GAME_LOGS:
+        return None
+    with past_n_tables_lock:
+        if gameday not in past_n_tables:
+            stored_dates = game_logs.list_dates()
+            if not stored_dates:
+                return None
+            day_before = feature_store.to_date(gameday) - datetime.timedelta(days = 1)
+            if stored_dates[-1] < day_before:
+                update_game_logs((stored_dates[-1] + datetime.timedelta(days = 1)).strftime("%m/%d/%Y"), 
+                                 day_before.strftime("%m/%d/%Y"))
+
+            # Windows don't reach back into the previous season, like the API's
+            season_start = datetime.date(feature_store.to_date(gameday).year, 1, 1)
+            past_n_tables[gameday] = {
+                group: game_logs.past_n_games(group, windows, gameday, 
+                                              logs=game_logs.read_logs(group, start_date=season_start, before=gameday))
+                for group, windows in [('hitting', BATTING_WINDOWS), ('pitching', PITCHING_WINDOWS)]}
+        return past_n_tables[gameday]
+
+def add_past_n_stats(profiles, hitting_tables):
+    """
+    Adds past N game stats from the game log store to profiles from 
+    fetch_player_profiles(), in place, under the same keys the API's 
+    stats would have been (i.e. 'lastXGames_7'). Players with no games 
+    stored get none, like players the API has no games for.
+
+    Parameters 
+    -----–-----------
+    profiles: dict
+        Maps player IDs to profiles, as returned by fetch_player_profiles().
+
+    hitting_tables: dict
+        The 'hitting' tables from get_past_n_tables().
+    """
+    for n, table in hitting_tables.items():
+        for player_id, profile in profiles.items():
+            if player_id in table.index:
+                profile['stats']['lastXGames_{}'.format(n)] = table.loc[player_id].to_dict()
 
 
 ################################################## FUNCTION TO GENERATE DATA #######################################################
 
-def generate_hits_data(generate_train_data=True):
+@instrumentation.traced('feature')
+def get_game_matchups(game):
+    """
+    Gets everything needed to build rows for a single game: the likely
+    starters on both teams (see select_candidates), both probable pitchers' rows from the day's 
+    pitcher table (see get_pitcher_table), and a profile for every player
+    (see fetch_player_profiles). Returns a list of tuples, one per 
+    player, of the form
+    
+        (player_name, player_profile, home_or_away, opposing_pitcher, game_id)
+    
+    with home players listed before away players. player_profile is None
+    if the API returned no profile for the player.
+
+    Parameters 
+    -----–-----------
+    game: dict
+        A single game, as returned by statsapi.schedule().
+    """
+    game_id = game['game_id']
+    gameday = datetime.datetime.strptime(game['game_date'], "%Y-%m-%d").strftime("%m/%d/%Y")
+
+    # Only likely starters go on to have their stats fetched. Lineups and
+    # rosters come with player IDs, so no names need to be looked up.
+    lineups = get_lineups(gameday).get(game_id, {})
+    home_roster = select_candidates(game['home_id'], lineups.get('home'), gameday)
+    away_roster = select_candidates(game['away_id'], lineups.get('away'), gameday)
+
+    probable_pitcher_ids, pitcher_table = get_pitcher_table(gameday)
+    game_pitcher_ids = probable_pitcher_ids.get(game_id, {})
+    home_pitcher = pitcher_features(pitcher_table, game_pitcher_ids.get('home'))
+    away_pitcher = pitcher_features(pitcher_table, game_pitcher_ids.get('away'))
+
+    # Head-to-head stats come back with the profiles, in one batched 
+    # request per opposing pitcher. Past N game stats come from the game 
+    # log store when it's been started, instead of two more requests.
+    season = int(game['game_date'][:4])
+    tables = get_past_n_tables(gameday)
+    profile_requests = ['season'] if tables else None
+    home_profiles = fetch_player_profiles([player['id'] for player in home_roster], away_pitcher['id'], season, 
+                                          profile_requests)
+    away_profiles = fetch_player_profiles([player['id'] for player in away_roster], home_pitcher['id'], season, 
+                                          profile_requests)
+    if tables:
+        add_past_n_stats(home_profiles, tables['hitting'])
+        add_past_n_stats(away_profiles, tables['hitting'])
+
+    matchups = [(player['name'], home_profiles.get(player['id']), 'home', away_pitcher, game_id) 
+                for player in home_roster]
+    matchups += [(player['name'], away_profiles.get(player['id']), 'away', home_pitcher, game_id) 
+                 for player in away_roster]
+    return matchups
+
+@instrumentation.traced('feature')
+def build_player_row(player, profile, home_or_away, pitcher, game_id, hits_index=None):
+    """
+    Builds a single row of data for a player against the opposing 
+    team's probable pitcher. Returns None if the player is not a 
+    position player or their stats can't be found.
+
+    Parameters 
+    -----–-----------
+    player: str
+        The name of a player as a string (i.e. "Buster Posey")
+
+    profile: dict
+        The player's profile from fetch_player_profiles(), fetched 
+        against the opposing probable pitcher.
+
+    home_or_away: str
+        'home' or 'away', depending on which team the player is on.
+
+    pitcher: dict
+        The opposing probable pitcher's row from the day's pitcher table
+        (see get_pitcher_table), with their ID, handedness and stats 
+        over the past 5 games.
+
+    game_id: int
+        The 6-digit ID for the game, used for labeling training data.
+
+    hits_index: dict
+        The game's hits index from get_game_hits_index(game_id). If 
+        passed, the player_got_hit label is added to the row.
+    """
+    if profile is None:
+        return None
+    player_id = profile['id']
+    try:
+        new_row = list(get_current_season_stats(player, profile=profile).values())
+        new_row += list(batting_past_N_games(7, player_id, profile=profile).values())
+        new_row += list(batting_past_N_games(15, player_id, profile=profile).values())
+        new_row += list(pitcher['p5G'].values())
+        new_row += list(get_h2h_vs_pitcher(player_id, pitcher['id'], profile=profile).values())
+        new_row.append(float(check_pitcher_batter_opposite_hand(batter_id=player_id, 
+                                                              pitcher_id=pitcher['id'],
+                                                              batter_profile=profile,
+                                                              pitcher_right_handed=pitcher['right_handed'])))
+        if hits_index is not None:
+            new_row.append(player_got_hit_in_game(player_id, game_id, hits_index=hits_index))
+        return new_row
+    except (ValueError, IndexError, KeyError):
+        return None
+
+def rows_to_table(rows_list, labeled=True):
+    """
+    Turns rows from build_player_row() into a dataframe with the column 
+    schema defined in feature_store.py.
+
+    Parameters 
+    -----–-----------
+    rows_list: list of lists
+        The rows, as returned by build_player_row().
+
+    labeled: bool
+        Indicates whether the rows end with the player_got_hit label.
+    """
+    player_stats_columns = ID_COLUMNS + FEATURE_COLUMNS
+    if labeled:
+        player_stats_columns += [LABEL_COLUMN]
+    return pd.DataFrame(data=rows_list, columns=player_stats_columns)
+
+def write_player_stats(rows_list, gameday, labeled=True):
+    """
+    Writes a day's rows to its partition in the feature store (see 
+    feature_store.py), using the column schema defined there. Returns 
+    the path of the partition.
+
+    Parameters 
+    -----–-----------
+    rows_list: list of lists
+        The rows to write, as returned by build_player_row().
+
+    gameday: str
+        The day the rows are for, in MM/DD/YYYY format.
+
+    labeled: bool
+        Indicates whether the rows end with the player_got_hit label.
+    """
+    return feature_store.write_partition(rows_to_table(rows_list, labeled), gameday)
+
+@instrumentation.traced('feature')
+def build_game_rows(game, labeled=True):
+    """
+    Builds the rows for every player in a single game. Returns a list of
+    rows, as returned by build_player_row().
+
+    Parameters 
+    -----–-----------
+    game: dict
+        A single game, as returned by statsapi.schedule().
+
+    labeled: bool
+        Indicates whether to label the rows with the player_got_hit 
+        column, from the game's boxscore.
+    """
+    hits_index = get_game_hits_index(game['game_id']) if labeled else None
+    rows = [build_player_row(*matchup, hits_index=hits_index) for matchup in get_game_matchups(game)]
+    return [row for row in rows if row is not None]
+
+def generate_hits_data(generate_train_data=True, gameday=None):
     """
     Main data retrieval function. Combines all other functions defined
     above and generates data either for training or testing. Produces
-    a dataframe and writes it to a CSV, putting it in the data/player_stats
-    directory like so:
+    a dataframe and writes it to the feature store, as a partition like so:
     
-        data/player_stats/player_stats_08_20_2019.csv
+        data/feature_store/date=2019-08-20/part-0.parquet
     
-    The date at the end of the file name changes depending on the value
-    passed for generate_train_data.
+    The date of the partition changes depending on the value passed for
+    generate_train_data.
+
+    Games are fetched concurrently through a pool of MAX_WORKERS threads 
+    (see call_statsapi for rate limiting and retries). Each game's rows 
+    are staged on disk as soon as the game is done (see 
+    feature_store.StagedPartition), so a run that gets killed skips the
+    finished games when it's restarted, and rows aren't held in memory.
+    The partition is written once every game is done, with rows in the
+    same order as the schedule. A game that fails is left unstaged while
+    the rest finish, and then a RuntimeError is raised without writing
+    the partition, so running the day again retries only that game.
 
     Parameters 
     -----–-----------
     generate_train_data: bool
         Indicates whether the function should generate training or test
         data. Simply changes which day's games to look at. 
+
+    gameday: str
+        The day to generate data for, in MM/DD/YYYY format. Defaults to
+        yesterday for training data and today for test data.
     """
+    import statsapi
 
     ###############################################################
     # 
@@ -365,111 +1394,507 @@ def generate_hits_data(generate_train_data=True):
     #
     ################################################################
 
-    gameday = yesterday
+    if gameday is None:
+        gameday = feature_store.current_day(days_ago = 1)
+        if not GENERATE_TRAIN_DATA:
+            gameday = feature_store.current_day()
+
+    games = cached_call('live', statsapi.schedule, gameday)
+    staged = feature_store.StagedPartition(gameday, labeled=GENERATE_TRAIN_DATA)
+    remaining_games = [game for game in games if game['game_id'] not in staged.completed]
+    if len(remaining_games) < len(games):
+        print("Resuming {}: {} of {} games already done".format(gameday, len(games) - len(remaining_games), len(games)))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(build_game_rows, game, GENERATE_TRAIN_DATA): game['game_id'] 
+                   for game in remaining_games}
+        failed_games = []
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            game_id = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                # Left unstaged, so running the day again retries just this game
+                print("Game {} on {} failed: {!r}".format(game_id, gameday, e))
+                failed_games.append(game_id)
+                continue
+            feature_store.stage_game(rows_to_table(rows, GENERATE_TRAIN_DATA), gameday, game_id)
+            staged.add(game_id)
+
+    if failed_games:
+        raise RuntimeError("{} of {} games on {} failed ({}), run again to retry them".format(
+            len(failed_games), len(games), gameday, ", ".join(str(game_id) for game_id in failed_games)))
     if not GENERATE_TRAIN_DATA:
-        gameday = today
+        write_schedule_snapshot(gameday, games, {game_id: staged.row_count(game_id) for game_id in staged.completed})
+    file_to_generate = staged.finalize([game['game_id'] for game in games])
+    print("Finished generating file: {}".format(file_to_generate))
+    print(response_cache.summary())
 
-    rows_list = []
-    for game in tqdm(statsapi.schedule(gameday)):
+################################################## LATE-DAY REFRESH ###############################################################
 
-        game_id = game['game_id']
-        away_id = game['away_id']
-        home_id = game['home_id']
-        home_player_list = get_player_list(home_id)
-        away_player_list = get_player_list(away_id)
+def schedule_snapshot_path(gameday):
+    return os.path.join(SNAPSHOT_DIR, "schedule_{}.json".format(feature_store.to_date(gameday).isoformat()))
 
-        away_prob_Pname = convert_to_FL_format(game['away_probable_pitcher'])
-        home_prob_Pname = convert_to_FL_format(game['home_probable_pitcher'])
+def write_schedule_snapshot(gameday, games, row_counts):
+    """
+    Saves the probable pitchers and lineups a day's test partition is 
+    built from, along with how many rows each game has, in the order the
+    games appear in the partition:
 
-        away_probable_pitcher = get_player_id_from_name(away_prob_Pname)
-        home_probable_pitcher = get_player_id_from_name(home_prob_Pname)
+        {"date": "2019-09-17", "games": [{"game_id": 565905, "home_id": 137, "away_id": 119,
+         "home_pitcher": 605483, "away_pitcher": 592789, "home_lineup": null, "away_lineup": [...], 
+         "rows": 22}, ...]}
 
-        away_pitcher_p5G = pitching_past_N_games(5, away_probable_pitcher)
-        home_pitcher_p5G = pitching_past_N_games(5, home_probable_pitcher)
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day of the partition, in MM/DD/YYYY format.
 
-        for player in home_player_list:
-            player_id = get_player_id_from_name(player)
-            try:
-                new_row = list(get_current_season_stats(player).values())
-                new_row += list(batting_past_N_games(7, player_id).values())
-                new_row += list(batting_past_N_games(15, player_id).values())
-                new_row += list(away_pitcher_p5G.values())
-                new_row += list(get_h2h_vs_pitcher(player_id, away_probable_pitcher).values())
-                new_row.append(float(check_pitcher_batter_opposite_hand(batter_id=player_id, 
-                                                                      pitcher_id=away_probable_pitcher)))
-                if GENERATE_TRAIN_DATA:
-                    new_row.append(player_got_hit_in_game(player_id, game_id, 'home'))
-
-                rows_list.append(new_row)
-            except (ValueError, IndexError):
-                continue
+    games: list of dict
+        The day's games, as returned by statsapi.schedule(), in partition
+        order.
 
-        for player in away_player_list:
-            player_id = get_player_id_from_name(player)
-            try:
-                new_row = list(get_current_season_stats(player).values())
-                new_row += list(batting_past_N_games(7, player_id).values())
-                new_row += list(batting_past_N_games(15, player_id).values())
-                new_row += list(home_pitcher_p5G.values())
-                new_row += list(get_h2h_vs_pitcher(player_id, home_probable_pitcher).values())
-                new_row.append(float(check_pitcher_batter_opposite_hand(batter_id=player_id, 
-                                                                      pitcher_id=away_probable_pitcher)))
-                if GENERATE_TRAIN_DATA:
-                    new_row.append(player_got_hit_in_game(player_id, game_id, 'away'))
-
-                rows_list.append(new_row)
-            except (ValueError, IndexError):
-                continue
-        
-    sample_hitter = get_player_id_from_name("Kevin Pillar")
-    sample_pitcher = get_player_id_from_name("Jacob DeGrom")
-    player_stats_columns = list(get_current_season_stats("Kevin Pillar").keys())
-    player_stats_columns += list(batting_past_N_games(7, sample_hitter).keys())
-    player_stats_columns += list(batting_past_N_games(15, sample_hitter).keys())
-    player_stats_columns += list(pitching_past_N_games(5, sample_pitcher).keys())
-    player_stats_columns += list(get_h2h_vs_pitcher(sample_hitter, sample_pitcher).keys())
-
-    if GENERATE_TRAIN_DATA:
-        player_stats_columns += ['pitcher_hitter_opposite_hand', 'player_got_hit']
+    row_counts: dict
+        Maps each game ID to its number of rows in the partition.
+    """
+    probable_pitcher_ids = get_probable_pitcher_ids(gameday)
+    lineups = get_lineups(gameday)
+    snapshot_games = []
+    for game_id in OrderedDict.fromkeys(game['game_id'] for game in games):
+        game = next(game for game in games if game['game_id'] == game_id)
+        snapshot_game = {'game_id': game_id, 'home_id': game['home_id'], 'away_id': game['away_id'], 
+                         'rows': row_counts[game_id]}
+        for side in ['home', 'away']:
+            snapshot_game[side + '_pitcher'] = probable_pitcher_ids.get(game_id, {}).get(side)
+            lineup = lineups.get(game_id, {}).get(side)
+            snapshot_game[side + '_lineup'] = [player['id'] for player in lineup] if lineup else None
+        snapshot_games.append(snapshot_game)
+
+    with atomic_files.replace_file(schedule_snapshot_path(gameday)) as f:
+        json.dump({'date': feature_store.to_date(gameday).isoformat(), 'games': snapshot_games}, f)
+
+def schedule_signature(gameday):
+    """
+    Returns the probable pitchers and lineups on a day's latest schedule,
+    i.e. [{"game_id": 565905, "home_pitcher": 605483, "away_pitcher": 592789,
+    "home_lineup": null, "away_lineup": [...]}, ...], the same fields a
+    schedule snapshot has (see write_schedule_snapshot). It changes 
+    whenever refresh_test_data would have something to update.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to look up, in MM/DD/YYYY format.
+    """
+    get_hydrated_schedule(gameday, refresh=True)
+    probable_pitcher_ids = get_probable_pitcher_ids(gameday)
+    lineups = get_lineups(gameday)
+    signature = []
+    for game_id in sorted(probable_pitcher_ids):
+        game = {'game_id': game_id}
+        for side in ['home', 'away']:
+            game[side + '_pitcher'] = probable_pitcher_ids[game_id][side]
+            lineup = lineups[game_id][side]
+            game[side + '_lineup'] = [player['id'] for player in lineup] if lineup else None
+        signature.append(game)
+    return signature
+
+def patch_pitcher_columns(player_stats_table, batters, pitcher, season):
+    """
+    Recomputes the columns that depend on the opposing pitcher (past 5
+    game pitching stats, head-to-head stats and opposite handedness) for
+    some of a partition's rows, in place. Head-to-head stats and batter
+    handedness come from one batched request.
+
+    Parameters 
+    -----–-----------
+    player_stats_table: pd.DataFrame
+        A day's rows, as read from the feature store.
+
+    batters: pd.Series of bool
+        Which rows face the pitcher.
+
+    pitcher: dict
+        The pitcher's row from the day's pitcher table (see 
+        get_pitcher_table).
+
+    season: int
+        The season to get head-to-head stats for (i.e. 2019)
+    """
+    batter_ids = player_stats_table.loc[batters, 'ID'].tolist()
+    profiles = fetch_player_profiles(batter_ids, pitcher['id'], season, requests=['season'])
+
+    h2h_rows, opposite_hand = [], []
+    for batter_id in batter_ids:
+        profile = profiles.get(batter_id, {'stats': {}})
+        h2h_rows.append(list(get_h2h_vs_pitcher(batter_id, pitcher['id'], profile=profile).values()))
+        opposite_hand.append(float(check_pitcher_batter_opposite_hand(batter_id, pitcher['id'], 
+                                                                      batter_profile=profiles.get(batter_id),
+                                                                      pitcher_right_handed=pitcher['right_handed'],
+                                                                      season=season)))
+
+    for column, value in pitcher['p5G'].items():
+        player_stats_table.loc[batters, column] = value
+    if batter_ids:
+        player_stats_table.loc[batters, [stat + "_h2h" for stat in H2H_HITTING_STATS]] = h2h_rows
+    player_stats_table.loc[batters, 'pitcher_hitter_opposite_hand'] = opposite_hand
+
+def refresh_test_data(gameday=None, rescore=True):
+    """
+    Brings a day's test partition up to date with the latest probable 
+    pitchers and lineups, without rebuilding it from scratch. The current
+    schedule is compared against the snapshot the partition was built 
+    from (see write_schedule_snapshot), and for each game:
+
+        - a new game, or one whose lineups changed, has its rows rebuilt
+        - when a probable pitcher changed, only the columns that depend 
+          on the pitcher are recomputed for the batters facing them (see
+          patch_pitcher_columns)
+        - a game that's no longer on the schedule has its rows dropped
+        - anything else is left as is
+
+    The patched partition and a new snapshot are written, and today's 
+    picks are re-scored with the current saved model (see predict.py).
+    When nothing changed, neither is written. Without a snapshot, the 
+    whole day is generated instead.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to refresh, in MM/DD/YYYY format. Defaults to today.
+
+    rescore: bool
+        Indicates whether to re-score the day's picks afterwards.
+    """
+    import statsapi
+    gameday = gameday or feature_store.current_day()
+    snapshot = None
+    if os.path.exists(schedule_snapshot_path(gameday)) and os.path.exists(feature_store.partition_path(gameday)):
+        with open(schedule_snapshot_path(gameday)) as f:
+            snapshot = json.load(f)
+
+    if snapshot is None:
+        print("No snapshot for {}, generating the whole day".format(gameday))
+        generate_hits_data(generate_train_data=False, gameday=gameday)
     else:
-        player_stats_columns += ['pitcher_hitter_opposite_hand']
+        # Start from the latest schedule rather than this process's or 
+        # the response cache's copy
+        with pitcher_tables_lock:
+            pitcher_tables.pop(gameday, None)
+        games = call_statsapi(statsapi.schedule, gameday)
+        get_hydrated_schedule(gameday, refresh=True)
+        probable_pitcher_ids, pitcher_table = get_pitcher_table(gameday)
+        lineups = get_lineups(gameday)
 
-    player_stats_table = pd.DataFrame(data=rows_list, columns=player_stats_columns)
-    file_to_generate = "data/player_stats/player_stats_{}.csv".format(gameday.replace("/", "_"))
-    player_stats_table.to_csv(file_to_generate, index=False)
-    print("Finished generating file: {}".format(file_to_generate))
-    
-def generate_yesterdays_results():
+        # Split the partition back into games, using the snapshot's row counts
+        player_stats_table = feature_store.read_partition(gameday)
+        old_games, offset = {}, 0
+        for snapshot_game in snapshot['games']:
+            old_games[snapshot_game['game_id']] = (snapshot_game, 
+                                                   player_stats_table.iloc[offset:offset + snapshot_game['rows']].copy())
+            offset += snapshot_game['rows']
+
+        tables, row_counts = [], {}
+        changes = {'rebuilt': 0, 'patched': 0, 'unchanged': 0}
+        for game in games:
+            game_id = game['game_id']
+            if game_id in row_counts:
+                continue
+            game_lineups = {side: [player['id'] for player in lineup] if lineup else None 
+                            for side, lineup in lineups.get(game_id, {'home': None, 'away': None}).items()}
+
+            if game_id not in old_games or any(game_lineups[side] != old_games[game_id][0][side + '_lineup'] 
+                                               for side in ['home', 'away']):
+                game_table = rows_to_table(build_game_rows(game, labeled=False), labeled=False)
+                changes['rebuilt'] += 1
+            else:
+                snapshot_game, game_table = old_games[game_id]
+                patched = False
+                for pitcher_side, batting_side in [('home', 'away'), ('away', 'home')]:
+                    pitcher_id = probable_pitcher_ids.get(game_id, {}).get(pitcher_side)
+                    if pitcher_id != snapshot_game[pitcher_side + '_pitcher']:
+                        batters = game_table['Team'] == game[batting_side + '_id']
+                        patch_pitcher_columns(game_table, batters, pitcher_features(pitcher_table, pitcher_id), 
+                                              int(game['game_date'][:4]))
+                        patched = True
+                changes['patched' if patched else 'unchanged'] += 1
+
+            tables.append(game_table)
+            row_counts[game_id] = len(game_table)
+
+        dropped = len([game_id for game_id in old_games if game_id not in row_counts])
+        print("Refreshed {}: {} games rebuilt, {} patched, {} unchanged, {} dropped".format(
+            gameday, changes['rebuilt'], changes['patched'], changes['unchanged'], dropped))
+
+        if changes['rebuilt'] == changes['patched'] == dropped == 0 and list(row_counts) == list(old_games):
+            # Nothing changed, so the partition (and the picks) stay as they are
+            return
+
+        columns = ID_COLUMNS + FEATURE_COLUMNS
+        player_stats_table = pd.concat([table[columns] for table in tables], ignore_index=True) if tables \
+                             else pd.DataFrame(columns=columns)
+        write_schedule_snapshot(gameday, games, row_counts)
+        print("Finished generating file: {}".format(feature_store.write_partition(player_stats_table, gameday)))
+
+    if rescore:
+        import predict
+        try:
+            predict.predict(gameday)
+        except ValueError as e:
+            print("Skipping re-scoring: {}".format(e))
+
+################################################## HISTORICAL BACKFILL ############################################################
+
+def init_backfill_worker(workers, requests_per_second, use_cache, profile=False, fixture_settings=None, 
+                         use_game_logs=True):
+    """
+    Sets up a backfill worker process with the same request settings 
+    as the parent. The rate limit is split between the processes, so 
+    the API sees the same overall request rate.
+    """
+    global MAX_WORKERS, REQUESTS_PER_SECOND, USE_CACHE, USE_GAME_LOGS
+    MAX_WORKERS = workers
+    REQUESTS_PER_SECOND = requests_per_second
+    USE_CACHE = use_cache
+    USE_GAME_LOGS = use_game_logs
+    rate_limiters.clear()
+    # Forked workers start with a copy of the parent's traces (i.e. from
+    # update_game_logs), which would be sent back and counted twice
+    instrumentation.tracer.snapshot(reset=True)
+    if profile:
+        instrumentation.enable()
+    if fixture_settings:
+        fixtures.configure(*fixture_settings)
+
+def backfill_game(gameday, game):
+    """
+    Builds the labeled rows for one game and stages them on disk (see 
+    feature_store.stage_game). Returns the game's ID, along with the 
+    worker's traces since its last game when profiling (see 
+    instrumentation.py), so the parent process can add them to its own.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day the game was played, in MM/DD/YYYY format.
+
+    game: dict
+        A single game, as returned by statsapi.schedule().
+    """
+    feature_store.stage_game(rows_to_table(build_game_rows(game)), gameday, game['game_id'])
+    return game['game_id'], instrumentation.tracer.snapshot(reset=True) if instrumentation.ENABLED else None
+
+def backfill(start_date, end_date, processes=4):
+    """
+    Generates labeled training data for every day between start_date and
+    end_date, writing one partition per day to the feature store. Games are 
+    split across a pool of processes, and each finished game is staged on
+    disk and recorded in its day's manifest (see 
+    feature_store.StagedPartition), so rerunning the same command after a
+    crash only fetches the games that weren't finished. Days that already
+    have labeled partitions are skipped. A day's partition is written once
+    all of its games are done.
+
+    Note that season and head-to-head stats come from the API as of when
+    the backfill runs, not as of the day of the game. Past N game stats 
+    are as of the day of the game when the game log store has been 
+    started (see --game-logs); the days it's missing are added before 
+    the workers start.
+
+    Parameters 
+    -----–-----------
+    start_date, end_date: str
+        The first and last days to backfill, in MM/DD/YYYY format.
+
+    processes: int
+        The number of worker processes to use.
+    """
+    import statsapi
+    labeled_dates = set(feature_store.list_dates(labeled_only=True))
+    games_by_day = OrderedDict()
+    for gameday in date_range(start_date, end_date):
+        if feature_store.to_date(gameday) in labeled_dates:
+            continue
+        games = cached_call('live', statsapi.schedule, gameday)
+        games_by_day[gameday] = [game for game in games if game['status'] in FINAL_GAME_STATUSES]
+
+    stored_dates = game_logs.list_dates()
+    if games_by_day and USE_GAME_LOGS and stored_dates:
+        first_missing = min(stored_dates[-1] + datetime.timedelta(days = 1), feature_store.to_date(start_date))
+        update_game_logs(first_missing.strftime("%m/%d/%Y"), end_date)
+
+    staged = {gameday: feature_store.StagedPartition(gameday, labeled=True) for gameday in games_by_day}
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_backfill_worker,
+                             initargs=(MAX_WORKERS, REQUESTS_PER_SECOND / processes, USE_CACHE, 
+                                       instrumentation.ENABLED, fixtures.settings(), USE_GAME_LOGS)) as pool:
+        futures = {pool.submit(backfill_game, gameday, game): gameday 
+                   for gameday, games in games_by_day.items() for game in games 
+                   if game['game_id'] not in staged[gameday].completed}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            game_id, traces = future.result()
+            staged[futures[future]].add(game_id)
+            if traces:
+                instrumentation.tracer.merge(traces)
+
+    for gameday, games in games_by_day.items():
+        if not games:
+            continue
+        file_to_generate = staged[gameday].finalize([game['game_id'] for game in games])
+        print("Finished generating file: {}".format(file_to_generate))
+
+def date_range(start_date, end_date):
+    """
+    Returns a list of every date from start_date to end_date (inclusive),
+    in MM/DD/YYYY format.
+
+    Parameters 
+    -----–-----------
+    start_date, end_date: str
+        Dates in MM/DD/YYYY format (i.e. "08/20/2019")
+    """
+    start = datetime.datetime.strptime(start_date, "%m/%d/%Y")
+    end = datetime.datetime.strptime(end_date, "%m/%d/%Y")
+    return [(start + datetime.timedelta(days = i)).strftime("%m/%d/%Y") 
+            for i in range((end - start).days + 1)]
+
+def generate_labels(start_date, end_date):
+    """
+    Adds (or recomputes) the player_got_hit column for every feature store
+    partition between start_date and end_date, without fetching
+    any features again. Each game's boxscore is requested once, so this
+    can also turn a day's test data into training data once its games 
+    are over.
+
+    Players are matched to boxscores by ID over the whole day, so a 
+    player in a doubleheader is labeled as getting a hit if they got 
+    one in either game.
+
+    Parameters 
+    -----–-----------
+    start_date, end_date: str
+        The first and last days to label, in MM/DD/YYYY format.
+    """
+    import statsapi
+    for gameday in date_range(start_date, end_date):
+        if not os.path.exists(feature_store.partition_path(gameday)):
+            continue
+
+        games = cached_call('live', statsapi.schedule, gameday)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            hits_indexes = list(executor.map(get_game_hits_index, [game['game_id'] for game in games]))
+
+        day_hits = {}
+        for hits_index in hits_indexes:
+            for player_id, hits in hits_index.items():
+                day_hits[player_id] = day_hits.get(player_id, 0) + hits
+
+        player_stats_table = feature_store.read_partition(gameday)
+        player_stats_table[LABEL_COLUMN] = player_stats_table['ID'].map(lambda x: day_hits.get(x, 0) > 0)
+        print("Labeled file: {}".format(feature_store.write_partition(player_stats_table, gameday)))
+
+def generate_yesterdays_results(gameday=None):
     """
     Generates tables to put on the Past Results page for project 
-    website. Puts the tables in the data/past_results directory.  
+    website. Puts the tables in the data/past_results directory and the
+    site index (see publish.py). Does nothing if there are no 
+    predictions for the day.
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to generate results for, in MM/DD/YYYY format. Defaults
+        to yesterday.
     """
-    
-    pred_yest = pd.read_csv("data/predictions/predictions_{}.csv".format(yesterday.replace("/", "_")))
-    stats_yest = pd.read_csv("data/player_stats/player_stats_{}.csv".format(yesterday.replace("/", "_")))
+    gameday = gameday or feature_store.current_day(days_ago = 1)
+
+    predictions_file = publish.day_file(publish.PREDICTIONS_FILE, gameday)
+    if not os.path.exists(predictions_file):
+        # i.e. the first day of the season, or a day that wasn't predicted
+        print("No predictions for {}, no results to generate".format(gameday))
+        return
+    pred_yest = pd.read_csv(predictions_file)
+    stats_yest = feature_store.read_partition(gameday, columns=['Name', LABEL_COLUMN])
     
     past_results = stats_yest[stats_yest['Name'].isin(pred_yest['Name'])].loc[:, ['Name', 'player_got_hit']]
     past_results['player_got_hit'] = past_results['player_got_hit'].apply(lambda x: "Yes" if x == 1.0 else "No")
-    past_results = past_results.append({'Name': 'Overall Accuracy', 
-                                        'player_got_hit': sum(past_results['player_got_hit'] == 'Yes') / 10}, 
-                                       ignore_index=True)
+    # Score against the picks that were actually found in yesterday's 
+    # stats, rather than assuming there were 10 of them
+    overall_accuracy = np.mean(past_results['player_got_hit'] == 'Yes') if len(past_results) else float("nan")
+    past_results = pd.concat([past_results, pd.DataFrame([{'Name': 'Overall Accuracy', 
+                                                           'player_got_hit': overall_accuracy}])], 
+                             ignore_index=True)
     
-    past_results.to_csv("data/past_results/past_results_{}.csv".format(yesterday.replace("/", "_")), index=False)
-    print("Results for {} generated".format(yesterday))
+    past_results.to_csv(publish.day_file(publish.PAST_RESULTS_FILE, gameday), index=False)
+    publish.publish_days([gameday])
+    print("Results for {} generated".format(gameday))
 
 # Adding arguments for running from command line or in .sh script. 
 
-arg_parser = argparse.ArgumentParser(description="Run to generate training data from yesterday's games and test data from today's games")
-arg_parser.add_argument("--train", help = "Use if you want to generate training data only", action="store_true")
-arg_parser.add_argument("--test", help = "Use if you want to generate test data only", action="store_true")
-args = arg_parser.parse_args()
-
-if args.train:
-    generate_hits_data()
-elif args.test:
-    generate_hits_data(generate_train_data=False)
-else:
-    generate_hits_data()
-    generate_hits_data(generate_train_data=False)
-    generate_yesterdays_results()
-    
\ No newline at end of file
+def main(argv=None):
+    global MAX_WORKERS, REQUESTS_PER_SECOND, USE_CACHE, USE_GAME_LOGS
+    arg_parser = argparse.ArgumentParser(description="Run to generate training data from yesterday's games and test data from today's games")
+    arg_parser.add_argument("--train", help = "Use if you want to generate training data only", action="store_true")
+    arg_parser.add_argument("--test", help = "Use if you want to generate test data only", action="store_true")
+    arg_parser.add_argument("--labels", help = "Only (re)label existing files between two dates, i.e. --labels 08/01/2019 08/31/2019", 
+                            nargs=2, metavar=("START", "END"))
+    arg_parser.add_argument("--backfill", help = "Generate training data for every day between two dates, i.e. --backfill 04/01/2019 09/15/2019", 
+                            nargs=2, metavar=("START", "END"))
+    arg_parser.add_argument("--game-logs", help = "Add every finished game between two dates to the game log store, i.e. --game-logs 03/28/2019 09/15/2019. Past N game stats are computed from the store once it has any days", 
+                            nargs=2, metavar=("START", "END"))
+    arg_parser.add_argument("--no-game-logs", help = "Request past N game stats from the API even if the game log store has been started", 
+                            action="store_true")
+    arg_parser.add_argument("--processes", help = "Number of worker processes to use with --backfill (default: 4)", 
+                            type=int, default=4)
+    arg_parser.add_argument("--workers", help = "Number of requests to have in flight at once (default: {})".format(MAX_WORKERS), 
+                            type=int, default=MAX_WORKERS)
+    arg_parser.add_argument("--no-cache", help = "Ignore and don't update the on-disk response cache", action="store_true")
+    arg_parser.add_argument("--rate-limit", help = "Maximum requests per second sent to the MLB API (default: {})".format(REQUESTS_PER_SECOND), 
+                            type=float, default=REQUESTS_PER_SECOND)
+    arg_parser.add_argument("--profile", help = "Trace every request and feature function and write a report to data/profiles", 
+                            action="store_true")
+    arg_parser.add_argument("--refresh", help = "Update today's test data for changed probable pitchers and lineups, then re-score the picks", 
+                            action="store_true")
+    arg_parser.add_argument("--date", help = "Generate data for this day instead of yesterday/today, i.e. 09/15/2019 (use with --train, --test or --refresh)")
+    arg_parser.add_argument("--record", help = "Save every API response to the fixture set data/fixtures/NAME", metavar="NAME")
+    arg_parser.add_argument("--replay", help = "Serve API responses from the fixture set data/fixtures/NAME instead of the API", 
+                            metavar="NAME")
+    arg_parser.add_argument("--latency", help = "Simulated seconds per request when replaying (default: 0)", 
+                            type=float, default=0.0)
+    args = arg_parser.parse_args(argv)
+
+    MAX_WORKERS = args.workers
+    REQUESTS_PER_SECOND = args.rate_limit
+    USE_CACHE = not args.no_cache
+    USE_GAME_LOGS = not args.no_game_logs
+    if args.profile:
+        # The report is written when the script exits, even if the run
+        # fails or is interrupted
+        instrumentation.enable()
+        atexit.register(instrumentation.write_report, "retrieve_data")
+    if args.record:
+        fixtures.configure('record', args.record)
+    elif args.replay:
+        fixtures.configure('replay', args.replay, latency=args.latency)
+
+    if args.game_logs:
+        update_game_logs(*args.game_logs)
+    elif args.backfill:
+        backfill(*args.backfill, processes=args.processes)
+    elif args.labels:
+        generate_labels(*args.labels)
+    elif args.refresh:
+        refresh_test_data(gameday=args.date)
+    elif args.train:
+        generate_hits_data(gameday=args.date)
+    elif args.test:
+        generate_hits_data(generate_train_data=False, gameday=args.date)
+    else:
+        # The days are worked out once, so a run that goes past midnight
+        # stays on the same days
+        yesterday, today = feature_store.current_day(days_ago = 1), feature_store.current_day()
+        generate_hits_data(gameday=yesterday)
+        generate_hits_data(generate_train_data=False, gameday=today)
+        generate_yesterdays_results(yesterday)
+
+if __name__ == "__main__":
+    main()
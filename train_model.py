@@ -1,139 +1,366 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import statsapi
-
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import precision_score, recall_score, f1_score
 
 import warnings
 warnings.filterwarnings('ignore')
 
+import atexit
 import datetime
-import glob
-import os
-
-# Retreive correct data files 
-
-yesterday = (datetime.datetime.today() - datetime.timedelta(days = 1)).strftime("%m_%d_%Y")
-today = datetime.datetime.today().strftime("%m_%d_%Y")
-
-data_files = glob.glob("data/player_stats/*.csv")
-data_files.sort(key=os.path.getmtime)
-last_7_generated = data_files[-9:-2]
-
-print("Getting data...")
-
-hits = pd.concat([pd.read_csv(f) for f in last_7_generated], sort=False)
-hits.dropna(inplace=True)
-hits.set_index(np.arange(len(hits)), inplace=True)
-hits['player_got_hit'] = hits['player_got_hit'].apply(float)
-
-data = hits.iloc[:, 3:-1]
-labels = hits.iloc[:, -1]
-
-hits_test = pd.read_csv("data/player_stats/player_stats_{}.csv".format(today))
-data_test = hits_test.iloc[:, 3:]
-
-data_train, data_val, labels_train, labels_val = train_test_split(data, labels, test_size=0.2)
-
-print("Data retrieved.")
-
-# LOGISTIC REGRESSION
-
-# Default params
-print("Training logistic regression...")
-logreg = LogisticRegression(penalty='l2').fit(data_train, labels_train)
-print("Finished training!")
-
-# ADABOOST
-
-from sklearn.ensemble import AdaBoostClassifier
-from sklearn.model_selection import GridSearchCV
-
-print("Finding best hyperparameters for AdaBoost...")
-param_grid = [
-    {'n_estimators': [50, 75, 100, 125, 150]}
-]
-
-ada_cv = GridSearchCV(AdaBoostClassifier(), param_grid, cv=4)
-ada_cv.fit(data_train, labels_train)
-
-print("Training AdaBoost...")
-boosted_dt = AdaBoostClassifier(n_estimators=ada_cv.best_params_['n_estimators'])
-boosted_dt.fit(data_train, labels_train)
-print("Finished training!")
-
-# RANDOM FORESTS
-
-from sklearn.ensemble import RandomForestClassifier
-
-print("Finding best hyperparameters for random forests...")
-param_grid = [
-    {'criterion': ['gini'], 'max_depth': [20], 'min_samples_leaf': [4, 10, 20, 30],
-    'n_estimators': [50, 75, 100, 125, 150]}
-]
-
-rf_cv = GridSearchCV(RandomForestClassifier(), param_grid, cv=4)
-rf_cv.fit(data_train, labels_train)
-best_rf_params = rf_cv.best_params_
-
-print("Training random forests...")
-rf_classifier = RandomForestClassifier(n_estimators=best_rf_params['n_estimators'], criterion=best_rf_params['criterion'], 
-                                       max_depth=best_rf_params['max_depth'], min_samples_leaf=best_rf_params['n_estimators'])
-rf_classifier.fit(data_train, labels_train)
-print("Finished training!")
-
-# Get model summaries
-
-acc_logreg = np.mean(logreg.predict(data_val) == labels_val)
-prec_logreg = precision_score(labels_val, logreg.predict(data_val))
-rec_logreg = recall_score(labels_val, logreg.predict(data_val))
-f1_logreg = f1_score(labels_val, logreg.predict(data_val))
-
-acc_rf = np.mean(rf_classifier.predict(data_val) == labels_val)
-prec_rf = precision_score(labels_val, rf_classifier.predict(data_val))
-rec_rf = recall_score(labels_val, rf_classifier.predict(data_val))
-f1_rf = f1_score(labels_val, rf_classifier.predict(data_val))
-
-acc_ada = np.mean(boosted_dt.predict(data_val) == labels_val)
-prec_ada = precision_score(labels_val, boosted_dt.predict(data_val))
-rec_ada = recall_score(labels_val, boosted_dt.predict(data_val))
-f1_ada = f1_score(labels_val, boosted_dt.predict(data_val))
-
-performance = pd.DataFrame([['Logreg', acc_logreg, prec_logreg, rec_logreg, f1_logreg],
-             ['Random Forests', acc_rf, prec_rf, rec_rf, f1_rf],
-             ['AdaBoost', acc_ada, prec_ada, rec_ada, f1_ada]], 
-             columns=['Model', 'Accuracy', 'Precision', 'Recall', "F1 Score"])
-print("Model performance summary on validation set: \n", performance)
-
-performance.to_csv("data/model_stats/performance_{}.csv".format(today), index=False)
-
-models_dict = {'Logreg': logreg, 'Random Forests': rf_classifier, 'AdaBoost': boosted_dt}
-best_model = models_dict[performance.sort_values('F1 Score', ascending=False).iloc[0]['Model']]
-
-# Make predictions
-
-predictions = hits_test.take(np.argsort(best_model.predict_proba(data_test)[:, 1])[::-1][:10])[['Name', 'Team']].reset_index().iloc[:, 1:]
-predictions.columns = ["name", "team_id"]
-predictions["team_name"] = predictions['team_id'].apply(lambda x: statsapi.lookup_team(x)[0]['name'])
-predictions["hit_probability"] = np.sort(rf_classifier.predict_proba(data_test)[:, 1])[::-1][:10]
-predictions.drop(['team_id'], axis=1, inplace=True)
-predictions.columns = ['Name', 'Team', 'Hit Probability']
-predictions.to_csv("data/predictions/predictions_{}.csv".format(today), index=False)
-
-print("Predictions for today: \n", predictions)
-
-# Add data for accuracy plot visualization for website
-
-accuracy_plot_data = pd.read_csv("data/plots/accuracy_plot_data.csv")
-new_day = today[:-5]
-latest_overall_acc = max(performance['Accuracy'])
-latest_top10_acc = float(predictions.iloc[-1]['player_got_hit'])
-accuracy_plot_data = accuracy_plot_data.append({"Day": new_day, 
-                           "Overall Accuracy": latest_overall_acc, 
-                           "Top 10 Accuracy": latest_top10_acc}, 
-                          ignore_index=True)
-accuracy_plot_data.to_csv("data/plots/accuracy_plot_data.csv")
+import time
+
+import argparse
+
+import dataset
+import evaluation
+import feature_store
+import instrumentation
+import model_registry
+import publish
+from predict import make_predictions
+
+################################################## GLOBAL VARIABLES ###############################################################
+
+# Fitted models and their hyperparameters are kept between runs in the
+# model registry (see model_registry.py), so most days only need to fit
+# the new day's rows. A full hyperparameter search runs every 
+# SEARCH_EVERY_DAYS days, when the models' F1 score on the new rows falls
+# more than DRIFT_THRESHOLD below their score at the last search, or when
+# run with --full-search.
+SEARCH_EVERY_DAYS = 7
+DRIFT_THRESHOLD = 0.05
+RF_TREES_PER_DAY = 25
+RF_MAX_TREES = 300
+
+# Hyperparameter search spaces (see search_spaces()) are searched with 
+# successive halving: SEARCH_CANDIDATES candidates are each scored on a 
+# small sample of rows, and only the best third move on to the next round
+# with three times as many rows. Fits run in parallel on N_JOBS cores
+# (-1 uses all of them).
+N_JOBS = -1
+SEARCH_CANDIDATES = 60
+
+################################################## TRAINING FUNCTIONS #############################################################
+
+# scikit-learn and scipy take a couple of seconds to import, so they're
+# imported by the functions that use them rather than at the top of this
+# module. Importing train_model (i.e. from backtest.py or to reuse the 
+# constants above) doesn't pay for them until a model is fit.
+
+def search_spaces():
+    """
+    Returns the hyperparameter search spaces for AdaBoost and random 
+    forests, mapping each model's name to a dictionary that maps each 
+    hyperparameter to a list of values or a distribution to sample from.
+    """
+    from scipy.stats import randint, loguniform
+
+    return {'AdaBoost': {'n_estimators': randint(25, 300), 'learning_rate': loguniform(0.01, 1.0)},
+            'Random Forests': {'criterion': ['gini', 'entropy'], 'max_depth': [10, 20, 30, None], 
+                               'min_samples_leaf': randint(2, 40), 'max_features': ['sqrt', 0.3, 0.5], 
+                               'n_estimators': randint(50, 300)}}
+
+@instrumentation.traced('stage')
+def run_search(name, model, search_space, data_train, labels_train):
+    """
+    Runs a successive halving search with 4-fold cross validation for 
+    one model, prints how long it took and how many candidates it tried,
+    and returns the best hyperparameters.
+
+    Parameters 
+    -----–-----------
+    name: str
+        The model's name, for printing (i.e. "AdaBoost")
+
+    model: sklearn estimator
+        An unfitted model to search over.
+
+    search_space: dict
+        Maps each hyperparameter to a list of values or a distribution 
+        to sample from.
+
+    data_train, labels_train: pd.DataFrame, pd.Series
+        Training features and labels.
+    """
+    from sklearn.experimental import enable_halving_search_cv
+    from sklearn.model_selection import HalvingRandomSearchCV
+
+    print("Finding best hyperparameters for {}...".format(name))
+    search = HalvingRandomSearchCV(model, search_space, n_candidates=SEARCH_CANDIDATES, factor=3, 
+                                   cv=4, scoring='f1', n_jobs=N_JOBS)
+    start = time.perf_counter()
+    search.fit(data_train, labels_train)
+    elapsed = time.perf_counter() - start
+
+    print("Evaluated {} candidates ({} fits over {} rounds) in {:.1f}s. Best F1: {:.3f}".format(
+        search.n_candidates_[0], len(search.cv_results_['params']) * 4, search.n_iterations_, 
+        elapsed, search.best_score_))
+    # Convert numpy scalars from the sampled distributions to plain Python
+    # values, so they can be saved in the model registry
+    return {k: (v.item() if hasattr(v, 'item') else v) for k, v in search.best_params_.items()}
+
+def search_hyperparameters(data_train, labels_train):
+    """
+    Searches for the best hyperparameters for AdaBoost and random forests.
+    Returns a dictionary mapping each model's name to its best 
+    hyperparameters.
+
+    Parameters 
+    -----–-----------
+    data_train: pd.DataFrame
+        Training features.
+
+    labels_train: pd.Series
+        Training labels.
+    """
+    from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
+
+    spaces = search_spaces()
+    return {'AdaBoost': run_search("AdaBoost", AdaBoostClassifier(), spaces['AdaBoost'], 
+                                   data_train, labels_train),
+            'Random Forests': run_search("random forests", RandomForestClassifier(), spaces['Random Forests'], 
+                                         data_train, labels_train)}
+
+@instrumentation.traced('stage')
+def fit_models(params, data_train, labels_train):
+    """
+    Trains all three models from scratch with the given hyperparameters.
+    Returns a dictionary mapping each model's name to the fitted model.
+
+    Parameters 
+    -----–-----------
+    params: dict
+        Hyperparameters, as returned by search_hyperparameters().
+
+    data_train: pd.DataFrame
+        Training features.
+
+    labels_train: pd.Series
+        Training labels.
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
+
+    print("Training logistic regression...")
+    logreg = LogisticRegression(penalty='l2', warm_start=True).fit(data_train, labels_train)
+
+    print("Training AdaBoost...")
+    boosted_dt = AdaBoostClassifier(**params['AdaBoost']).fit(data_train, labels_train)
+
+    print("Training random forests...")
+    rf_classifier = RandomForestClassifier(warm_start=True, n_jobs=N_JOBS, **params['Random Forests'])
+    rf_classifier.fit(data_train, labels_train)
+    print("Finished training!")
+
+    return {'Logreg': logreg, 'Random Forests': rf_classifier, 'AdaBoost': boosted_dt}
+
+@instrumentation.traced('stage')
+def update_models(models, params, data_train, labels_train, data_new, labels_new):
+    """
+    Updates previously fitted models for a new day of data without 
+    searching for hyperparameters again:
+
+        - Logistic regression is refit on the training window, starting 
+          from yesterday's coefficients (warm_start), so it converges in
+          a few iterations.
+        - Random forests grow RF_TREES_PER_DAY new trees fit only on the 
+          new rows (warm_start). The oldest trees are dropped once there
+          are more than RF_MAX_TREES, so the forest tracks the most
+          recent days.
+        - AdaBoost can't add data incrementally, so it's refit on the
+          training window with the saved hyperparameters.
+
+    Parameters 
+    -----–-----------
+    models: dict
+        The fitted models, as returned by fit_models().
+
+    params: dict
+        Hyperparameters, as returned by search_hyperparameters().
+
+    data_train, labels_train: pd.DataFrame, pd.Series
+        The full training window.
+
+    data_new, labels_new: pd.DataFrame, pd.Series
+        The training rows the models haven't seen yet.
+    """
+    from sklearn.ensemble import AdaBoostClassifier
+
+    print("Updating logistic regression...")
+    models['Logreg'].fit(data_train, labels_train)
+
+    print("Updating random forests...")
+    rf_classifier = models['Random Forests']
+    rf_classifier.n_estimators += RF_TREES_PER_DAY
+    rf_classifier.fit(data_new, labels_new)
+    if len(rf_classifier.estimators_) > RF_MAX_TREES:
+        rf_classifier.estimators_ = rf_classifier.estimators_[-RF_MAX_TREES:]
+        rf_classifier.n_estimators = RF_MAX_TREES
+
+    print("Updating AdaBoost...")
+    models['AdaBoost'] = AdaBoostClassifier(**params['AdaBoost']).fit(data_train, labels_train)
+    print("Finished training!")
+
+    return models
+
+@instrumentation.traced('stage')
+def best_f1(models, data, labels):
+    """
+    Returns the highest F1 score any of the models gets on the given data.
+    """
+    probabilities = evaluation.predict_probabilities(models, data)
+    return max(evaluation.threshold_metrics(model_probabilities, labels, [evaluation.DECISION_THRESHOLD])['F1 Score'][0]
+               for model_probabilities in probabilities.values())
+
+def training_dates(gameday, days=7):
+    """
+    Returns the days to train on for a day's picks: the last `days`
+    labeled days in the feature store before gameday, as datetime.date.
+    """
+    return [d for d in feature_store.list_dates(labeled_only=True) 
+            if d < feature_store.to_date(gameday)][-days:]
+
+def train_models(gameday=None, full_search=False):
+    """
+    The daily training run: trains (or updates) the models on the 7 most
+    recent labeled days in the feature store before gameday, scores them
+    on the validation rows, writes the scores to data/model_stats and 
+    saves the models to the model registry. Returns the fitted models, 
+    the name of the best one and the performance dataframe (see 
+    evaluation.evaluate_models).
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day the models will predict, in MM/DD/YYYY format. Defaults 
+        to today.
+
+    full_search: bool
+        Search for hyperparameters and retrain every model from scratch,
+        even if the saved models are recent enough to update.
+    """
+    gameday = gameday or feature_store.current_day()
+    day = feature_store.to_date(gameday).strftime("%m_%d_%Y")
+
+    # Retreive correct data files. Train on the 7 most recent labeled days 
+    # in the feature store before gameday.
+    train_dates = training_dates(gameday)
+
+    print("Getting data...")
+
+    # Features come as one float32 array in FEATURE_COLUMNS order, checked
+    # against the feature store's schema (see dataset.py)
+    hits = dataset.load_matrix(train_dates)
+
+    # Split into training and validation sets (see dataset.validation_mask)
+    in_val_set = dataset.validation_mask(hits)
+    data_train, data_val = hits.features[~in_val_set], hits.features[in_val_set]
+    labels_train, labels_val = hits.labels[~in_val_set], hits.labels[in_val_set]
+    dates_train = hits.dates[~in_val_set]
+
+    print("Data retrieved.")
+
+    # The training state is kept in the current registry version's metadata
+    state = None
+    if model_registry.read_registry()['current'] and not full_search:
+        state = model_registry.version_info()['metadata']
+        for key in ['searched_on', 'trained_through']:
+            state[key] = datetime.datetime.strptime(state[key], "%Y-%m-%d").date()
+        state['models'] = model_registry.load_models(mmap=False)
+
+    full_search = state is None
+    if not full_search:
+        new_rows = dates_train > np.datetime64(state['trained_through'])
+        days_since_search = (train_dates[-1] - state['searched_on']).days
+        new_f1 = best_f1(state['models'], data_train[new_rows], labels_train[new_rows]) if new_rows.any() else state['search_f1']
+        if days_since_search >= SEARCH_EVERY_DAYS:
+            print("Last hyperparameter search was {} days ago.".format(days_since_search))
+            full_search = True
+        elif state['search_f1'] - new_f1 > DRIFT_THRESHOLD:
+            print("F1 score on new data dropped from {:.3f} to {:.3f}.".format(state['search_f1'], new_f1))
+            full_search = True
+
+    if full_search:
+        params = search_hyperparameters(data_train, labels_train)
+        models = fit_models(params, data_train, labels_train)
+        state = {'params': params, 'searched_on': train_dates[-1], 
+                 'search_f1': best_f1(models, data_val, labels_val)}
+    elif new_rows.any():
+        params = state['params']
+        models = update_models(state['models'], params, data_train, labels_train, 
+                               data_train[new_rows], labels_train[new_rows])
+    else:
+        print("No new training data since the last run, using the saved models.")
+        models = state['models']
+
+    # Get model summaries. Each model scores the validation set once, and 
+    # every metric is computed from those probabilities.
+
+    performance, evaluation_details = evaluation.evaluate_models(models, data_val, labels_val, 
+                                                                 groups=hits.dates[in_val_set])
+    print("Model performance summary on validation set: \n", performance)
+
+    evaluation.write_model_stats(performance, evaluation_details, day)
+
+    best_model_name = performance.sort_values('F1 Score', ascending=False).iloc[0]['Model']
+
+    # Save this version of the models, so predict.py can rescore without training
+    model_registry.save_models(models, train_dates[-1], best_model_name, 
+                               metadata={'params': state['params'], 
+                                         'searched_on': state['searched_on'].isoformat(), 
+                                         'search_f1': state['search_f1'], 
+                                         'trained_through': train_dates[-1].isoformat(),
+                                         'feature_columns': feature_store.FEATURE_COLUMNS,
+                                         'performance': performance.to_dict('records')})
+    return models, best_model_name, performance
+
+def train_and_predict(gameday=None, full_search=False):
+    """
+    Trains the models for a day (see train_models), writes the day's top
+    10 picks with the best one, adds the day before to the accuracy plot
+    and publishes both days to the site index (see publish.py).
+
+    Parameters 
+    -----–-----------
+    gameday: str
+        The day to predict, in MM/DD/YYYY format. Defaults to today.
+
+    full_search: bool
+        See train_models().
+    """
+    gameday = gameday or feature_store.current_day()
+    models, best_model_name, performance = train_models(gameday, full_search)
+
+    # Make predictions
+
+    hits_test = feature_store.read_partition(gameday)
+    predictions = make_predictions(models[best_model_name], hits_test)
+    predictions.to_csv(publish.day_file(publish.PREDICTIONS_FILE, gameday), index=False)
+
+    print("Predictions for today: \n", predictions)
+
+    # Add data for accuracy plot visualization for website
+
+    yesterday = feature_store.to_date(gameday) - datetime.timedelta(days = 1)
+    publish.update_accuracy_plot(yesterday)
+    publish.publish_days([yesterday, gameday])
+
+def main(argv=None):
+    global N_JOBS
+    arg_parser = argparse.ArgumentParser(description="Train models on the last 7 days of data and predict today's top 10")
+    arg_parser.add_argument("--date", help = "The day to predict, i.e. 09/16/2019 (default: today)")
+    arg_parser.add_argument("--full-search", help = "Search for hyperparameters and retrain every model from scratch", 
+                            action="store_true")
+    arg_parser.add_argument("--n-jobs", help = "Number of cores to use for searching and training (default: all)", 
+                            type=int, default=N_JOBS)
+    arg_parser.add_argument("--profile", help = "Time each training stage and write a report to data/profiles", 
+                            action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    N_JOBS = args.n_jobs
+    if args.profile:
+        instrumentation.enable()
+        atexit.register(instrumentation.write_report, "train_model")
+
+    train_and_predict(args.date, full_search=args.full_search)
+
+if __name__ == "__main__":
+    main()
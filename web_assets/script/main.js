@@ -8,28 +8,34 @@ var today = new Date();
 today.setTime(today.getTime());
 document.getElementById("span-date").innerHTML = months[today.getMonth()] + " " + today.getDate() + ", " + today.getFullYear();
 
-var monthNumbers = ["01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11", "12"]
-var fileMonth = monthNumbers[today.getMonth()]
-
+var fileMonth = today.getMonth() + 1;
 var fileDate = today.getDate();
-if (fileDate < 10) {
-    fileDate = "0" + String(fileDate)
-}
+var todayKey = today.getFullYear() + "-" + (fileMonth < 10 ? "0" : "") + fileMonth + "-" + (fileDate < 10 ? "0" : "") + fileDate;
 
-var fileYear = today.getFullYear();
-var getURL = "https://raw.githubusercontent.com/rohannarain/beat_the_streak/master/data/predictions/predictions_" + fileMonth + "_" + fileDate + "_" + fileYear + ".csv" 
+// Every day's predictions, results and accuracy, in one file (see publish.py)
+var getURL = "https://raw.githubusercontent.com/rohannarain/beat_the_streak/master/data/site/index.json"
 
 // Source: https://codepen.io/heiswayi/pen/wKJGaw
 
-d3.text(getURL, function(data) {
-    var parsedCSV = d3.csv.parseRows(data);
+d3.json(getURL, function(error, index) {
+    if (error || !index.latest) {
+        return;
+    }
+
+    // Show the latest picks if today's haven't been published yet
+    var dayKey = index.days[todayKey] && index.days[todayKey].predictions ? todayKey : index.latest;
+    if (dayKey != todayKey) {
+        var parts = dayKey.split("-");
+        document.getElementById("span-date").innerHTML = months[Number(parts[1]) - 1] + " " + Number(parts[2]) + ", " + parts[0];
+    }
+    var predictions = index.days[dayKey].predictions;
 
     var container = d3.select("header")
         .append("table")
         // .attr("class", "table")
 
     .selectAll("tr")
-        .data(parsedCSV).enter()
+        .data([predictions.columns].concat(predictions.rows)).enter()
         .append("tr")
 
     .selectAll("td")
@@ -8,113 +8,89 @@ var today = new Date();
 today.setTime(today.getTime());
 document.getElementById("span-date").innerHTML = months[today.getMonth()] + " " + today.getDate() + ", " + today.getFullYear();
 
-var tempDate = new Date();
+// Every day's predictions, results and accuracy, in one file (see publish.py)
+var indexURL = "https://raw.githubusercontent.com/rohannarain/beat_the_streak/master/data/site/index.json";
 
-function padForDate(number) {
-    return number < 10 ? '0'+number : number;
+function formatDayKey(dayKey) {
+    // 2019-09-15 -> 9/15/2019
+    var parts = dayKey.split("-");
+    return Number(parts[1]) + "/" + Number(parts[2]) + "/" + parts[0];
 }
 
-function formatToDateInURL(str) {
-    var removeSlashes = str.replace("/", "_").replace("/", "_")
-    var firstUnderscore = removeSlashes.indexOf("_")
-    var secondUnderscore = removeSlashes.lastIndexOf("_")
+function showError(header) {
+    header.select("#error-message").remove();
 
-    var month = padForDate(removeSlashes.slice(0, firstUnderscore))
-    var day = padForDate(removeSlashes.slice(firstUnderscore+1, secondUnderscore))
-    var year = removeSlashes.slice(secondUnderscore+1)
+    header.append("div")
+    .attr("class", "alert alert-warning")
+    .attr("role", "alert")
+    .attr("id", "error-message")
+    .attr("style", "text-align: center")
+    .text("Sorry, it doesn't look like there are any results for that date.");
+}
 
-    return month + "_" + day + "_" + year
+function appendTable(parent, rows) {
+    parent.append("table")
+        .attr("class", "table")
+
+    .selectAll("tr")
+        .data(rows).enter()
+        .append("tr")
+
+    .selectAll("td")
+        .data(function(d) {
+            return d;
+        }).enter()
+        .append("td")
+        .text(function(d) {
+            return d;
+    });
 }
 
-for (i = 1, len = 8; i < len; i++) {
-    var prevDate = tempDate.getDate() - 1;
-    tempDate.setDate(prevDate);
-    var prevDateFormatted = tempDate.toLocaleDateString();
-    var dropdown = d3.select(".dropdown-menu")
+d3.json(indexURL, function(error, index) {
+    if (error) {
+        showError(d3.select("header"));
+        return;
+    }
+
+    // The 7 most recent days with results, newest first
+    var dayKeys = Object.keys(index.days).filter(function(dayKey) {
+        return index.days[dayKey].results;
+    }).sort().reverse().slice(0, 7);
+
+    d3.select(".dropdown-menu")
+        .selectAll(".dropdown-item")
+        .data(dayKeys).enter()
         .append("a")
         .attr("class", "dropdown-item")
-        .attr("id", "date" + prevDateFormatted)
-        .text(prevDateFormatted);
-}
+        .attr("id", function(dayKey) {
+            return "date" + dayKey;
+        })
+        .text(formatDayKey);
 
-var dropdownItem = d3.selectAll(".dropdown-item");
+    d3.selectAll(".dropdown-item").on("click", function(dayKey) {
+        var day = index.days[dayKey];
 
-dropdownItem.on("click", function() {
-    var dateToRetrieve = this.id.slice(4);
-    var dateInURL = formatToDateInURL(dateToRetrieve);
-    var getURL = "https://raw.githubusercontent.com/rohannarain/beat_the_streak/master/data/past_results/past_results_" + dateInURL + ".csv";
+        header = d3.select("header");
+        header.selectAll("table").remove();
+        header.selectAll(".table-responsive").remove();
+        header.select("#error-message").remove();
 
-    var performanceStatsURL = "https://raw.githubusercontent.com/rohannarain/beat_the_streak/master/data/model_stats/performance_" + dateInURL + ".csv";
+        d3.select("#dropdownMenuButton").text(formatDayKey(dayKey))
 
-    header = d3.select("header");
-    header.selectAll("table").remove();
-    header.select("#error-message").remove();
-
-    d3.select("#dropdownMenuButton").text(dateToRetrieve)
-
-    d3.text(getURL, function(data) {
-        try {
-            var parsedCSV = d3.csv.parseRows(data);
-            var container = d3.select("header")
-                .append("table")
-                .attr("class", "table")
-
-            .selectAll("tr")
-                .data(parsedCSV).enter()
-                .append("tr")
-
-            .selectAll("td")
-                .data(function(d) {
-                    return d;
-                }).enter()
-                .append("td")
-                .text(function(d) {
-                    return d;
-            });            
-        }
-        catch(error) {
-            header.select("#error-message").remove();
-
-            header.append("div")
-            .attr("class", "alert alert-warning")
-            .attr("role", "alert")
-            .attr("id", "error-message")
-            .attr("style", "text-align: center")
-            .text("Sorry, it doesn't look like there are any results for that date.");
+        if (!day || !day.results) {
+            showError(header);
+            return;
         }
-    });
 
-    d3.text(performanceStatsURL, function(data) {
-        try {
-            var parsedCSV = d3.csv.parseRows(data);
-            var container = d3.select("header")
-                .append("div")
-                .attr("class", "table-responsive")
-                .append("table")
-                .attr("class", "table")
-
-            .selectAll("tr")
-                .data(parsedCSV).enter()
-                .append("tr")
-
-            .selectAll("td")
-                .data(function(d) {
-                    return d;
-                }).enter()
-                .append("td")
-                .text(function(d) {
-                    return d;
-            });            
+        var results = [day.results.columns].concat(day.results.rows);
+        if (day.accuracy) {
+            results.push(["Overall Accuracy", day.accuracy.top10]);
         }
-        catch(error) {
-            header.select("#error-message").remove();
-
-            header.append("div")
-            .attr("class", "alert alert-warning")
-            .attr("role", "alert")
-            .attr("id", "error-message")
-            .attr("style", "text-align: center")
-            .text("Sorry, it doesn't look like there are any results for that date.");
+        appendTable(header, results);
+
+        if (day.performance) {
+            appendTable(header.append("div").attr("class", "table-responsive"),
+                        [day.performance.columns].concat(day.performance.rows));
         }
     });
 });